@@ -0,0 +1,223 @@
+"""Reading analytics built on the per-user daily rollup table.
+
+The rollups hold one row per user and day, so every query here touches at
+most a few thousand small rows even for a decade of diary entries.
+"""
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from sqlalchemy import delete, func, insert, select
+import community
+from models import db, Book, ReadingDiary, DailyReadingRollup
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+# ============================================
+# Rollup maintenance
+# ============================================
+
+def _diary_totals():
+    """Columns aggregating diary entries into one rollup row."""
+    return (
+        func.coalesce(func.sum(ReadingDiary.pages_read), 0),
+        func.coalesce(func.sum(ReadingDiary.reading_time), 0),
+        func.count(func.distinct(ReadingDiary.book_id))
+    )
+
+
+def refresh_daily_rollup(user_id, day):
+    """Recompute the rollup row for one user and day.
+
+    Call after flushing a diary write, inside the same transaction.
+    """
+    refresh_daily_rollups(user_id, [day])
+
+
+def refresh_daily_rollups(user_id, days):
+    """Recompute the rollup rows of several days in two statements."""
+    days = sorted(set(days))
+    if days:
+        _rebuild(user_id, days)
+
+
+def rebuild_daily_rollups(user_id=None):
+    """Rebuild the rollup table from the diary. Returns the number of rows."""
+    result = _rebuild(user_id)
+    db.session.commit()
+    return result.rowcount
+
+
+def _rebuild(user_id=None, days=None):
+    """Replace the matching rollup rows with fresh totals from the diary.
+
+    Changes to one user's rows are passed on to the community totals; after
+    a full rebuild, run `community.rebuild()`.
+    """
+    before = community.reading_snapshot(user_id, days) if user_id is not None else None
+    clear = delete(DailyReadingRollup).execution_options(synchronize_session=False)
+    source = select(ReadingDiary.user_id, ReadingDiary.date, *_diary_totals())
+    if user_id is not None:
+        clear = clear.where(DailyReadingRollup.user_id == user_id)
+        source = source.where(ReadingDiary.user_id == user_id)
+    if days is not None:
+        clear = clear.where(DailyReadingRollup.date.in_(days))
+        source = source.where(ReadingDiary.date.in_(days))
+
+    db.session.execute(clear)
+    result = db.session.execute(
+        insert(DailyReadingRollup).from_select(
+            ['user_id', 'date', 'pages', 'minutes', 'books_touched'],
+            source.group_by(ReadingDiary.user_id, ReadingDiary.date)
+        )
+    )
+    if before is not None:
+        community.record_reading(user_id, days, before)
+    return result
+
+
+# ============================================
+# Queries
+# ============================================
+
+def _rollups(user_id, start, end):
+    """(date, pages, minutes, books_touched) rows in [start, end), by date."""
+    return db.session.execute(
+        select(
+            DailyReadingRollup.date,
+            DailyReadingRollup.pages,
+            DailyReadingRollup.minutes,
+            DailyReadingRollup.books_touched
+        ).where(
+            DailyReadingRollup.user_id == user_id,
+            DailyReadingRollup.date >= start,
+            DailyReadingRollup.date < end
+        ).order_by(DailyReadingRollup.date)
+    ).all()
+
+
+def heatmap(user_id, start, end):
+    """Pages per day in [start, end), only for days with entries."""
+    return [[d.isoformat(), pages] for d, pages, _, _ in _rollups(user_id, start, end)]
+
+
+def weekday_distribution(user_id, start, end):
+    """Total and average pages/minutes for each weekday in [start, end)."""
+    return _weekday_totals(_rollups(user_id, start, end))
+
+
+def _weekday_totals(rows):
+    pages = Counter()
+    minutes = Counter()
+    days = Counter()
+    for d, day_pages, day_minutes, _ in rows:
+        weekday = d.weekday()
+        pages[weekday] += day_pages
+        minutes[weekday] += day_minutes
+        days[weekday] += 1
+
+    return [{
+        'weekday': name,
+        'pages': pages[i],
+        'minutes': minutes[i],
+        'days': days[i],
+        'avg_pages': round(pages[i] / days[i], 1) if days[i] else 0
+    } for i, name in enumerate(WEEKDAYS)]
+
+
+def moving_average(user_id, start, end, window=7):
+    """Daily pages in [start, end) with a trailing `window`-day average.
+
+    Days without entries count as zero pages.
+    """
+    # Read the days before `start` too, so the first averages are complete
+    # (as far back as the calendar goes)
+    lookback = start - timedelta(days=min(window - 1, (start - date.min).days))
+    pages = {d: p for d, p, _, _ in _rollups(user_id, lookback, end)}
+
+    series = []
+    running = 0
+    day = lookback
+    while day < end:
+        running += pages.get(day, 0)
+        if (day - lookback).days >= window:
+            running -= pages.get(day - timedelta(days=window), 0)
+        if day >= start:
+            series.append({
+                'date': day.isoformat(),
+                'pages': pages.get(day, 0),
+                'average': round(running / window, 1)
+            })
+        day += timedelta(days=1)
+    return series
+
+
+def _longest_streak(days):
+    """Longest run of consecutive dates in a sorted list."""
+    longest = current = 0
+    previous = None
+    for d in days:
+        current = current + 1 if previous and d - previous == timedelta(days=1) else 1
+        longest = max(longest, current)
+        previous = d
+    return longest
+
+
+def finish_rate_by_genre(user_id, start=None, end=None):
+    """Books started vs. finished per genre, optionally for starts in [start, end)."""
+    finished = func.sum(db.case((Book.status == 'read', 1), else_=0))
+    query = select(Book.genre, func.count(Book.id), finished).where(
+        Book.user_id == user_id,
+        Book.start_date.isnot(None)
+    )
+    if start is not None:
+        query = query.where(Book.start_date >= start, Book.start_date < end)
+    rows = db.session.execute(query.group_by(Book.genre)).all()
+
+    return sorted([{
+        'genre': genre or None,
+        'started': started,
+        'finished': done or 0,
+        'rate': round((done or 0) / started, 2) if started else 0
+    } for genre, started, done in rows], key=lambda g: -g['started'])
+
+
+def year_in_review(user_id, year):
+    """Summary of a reading year."""
+    start, end = date(year, 1, 1), date(year + 1, 1, 1)
+    rows = _rollups(user_id, start, end)
+
+    monthly = defaultdict(int)
+    for d, pages, _, _ in rows:
+        monthly[d.month] += pages
+    best_month = max(monthly, key=monthly.get) if monthly else None
+
+    finished = db.session.execute(
+        select(Book.title, Book.author, Book.genre, Book.pages, Book.rating).where(
+            Book.user_id == user_id,
+            Book.end_date >= start,
+            Book.end_date < end
+        ).order_by(Book.end_date)
+    ).all()
+    authors = Counter(b.author for b in finished if b.author)
+    genres = Counter(b.genre for b in finished if b.genre)
+    weekdays = _weekday_totals(rows)
+
+    return {
+        'year': year,
+        'pages': sum(r[1] for r in rows),
+        'minutes': sum(r[2] for r in rows),
+        'days_read': sum(1 for r in rows if r[1] > 0),
+        'longest_streak': _longest_streak([r[0] for r in rows if r[1] > 0]),
+        'best_month': f'{year}-{best_month:02d}' if best_month else None,
+        'best_weekday': max(weekdays, key=lambda w: w['pages'])['weekday'] if rows else None,
+        'monthly_pages': [monthly.get(m, 0) for m in range(1, 13)],
+        'books_finished': len(finished),
+        'pages_finished': sum(b.pages or 0 for b in finished),
+        'top_authors': [{'author': a, 'count': n} for a, n in authors.most_common(5)],
+        'top_genres': [{'genre': g, 'count': n} for g, n in genres.most_common(5)],
+        'genres': finish_rate_by_genre(user_id, start, end),
+        'top_rated': [
+            {'title': b.title, 'author': b.author, 'rating': b.rating}
+            for b in sorted(finished, key=lambda b: -(b.rating or 0))[:5] if b.rating
+        ]
+    }
@@ -1,18 +1,44 @@
+import json
 import os
+import time
 from datetime import datetime, date, timedelta
 from functools import wraps
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, abort, stream_with_context
 from flask_cors import CORS
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from sqlalchemy import func
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import joinedload
 from config import Config
-from models import db, User, Book, ReadingDiary, Note, DailyQuote, init_quotes
+from models import (
+    db, User, Book, ReadingDiary, Note, DailyQuote, Job, init_quotes,
+    apply_reading_progress, repair_reading_progress, outdated_tables, upgrade_schema
+)
+import analytics
+import assets
+import community
+import compression
+import covers
+import forecast
+import health
+import jobs
+import profiling
+import querylog
 import random
+import recommend
+import replicas
 
 app = Flask(__name__)
 app.config.from_object(Config)
 CORS(app)
 db.init_app(app)
+profiling.init_app(app)
+assets.init_app(app)
+compression.init_app(app)
+covers.init_app(app)
+health.init_app(app)
+jobs.init_app(app)
+querylog.init_app(app)
+replicas.init_app(app)
 
 # Flask-Login setup
 login_manager = LoginManager()
@@ -36,13 +62,68 @@ def unauthorized():
     return redirect(url_for('login_page'))
 
 
-# Ensure upload folder exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# ============================================
+# CLI Commands
+# ============================================
 
-# Initialize database
-with app.app_context():
+# Importing this module must stay free of I/O: every gunicorn worker imports
+# it, so schema creation and seeding run once per deploy via these commands.
+
+def init_database():
+    """Create missing tables, upgrade old ones and create the upload folder."""
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     db.create_all()
+    for table in upgrade_schema(db.engine):
+        app.logger.warning('Upgraded table %s to the current schema', table)
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database tables and fill in what they lack."""
+    init_database()
+    print('Banco de dados inicializado.')
+    count = recommend.refresh_missing_features()
+    if count:
+        print(f'Características calculadas para {count} livro(s) antigo(s).')
+    missing = covers.forget_missing_covers(app)
+    if missing:
+        print(f'{missing} capa(s) sem arquivo local; as remotas serão baixadas novamente.')
+
+
+@app.cli.command('seed')
+def seed_command():
+    """Load the literary quotes if the table is empty."""
     init_quotes(db)
+    print('Citações carregadas.')
+
+
+@app.cli.command('repair-progress')
+def repair_progress_command():
+    """Backfill/repair the per-book reading progress counters."""
+    count = repair_reading_progress()
+    print(f'Progresso recalculado para {count} livro(s).')
+
+
+@app.cli.command('rebuild-features')
+def rebuild_features_command():
+    """Recompute the book features behind the queue suggestions."""
+    count = recommend.rebuild_book_features()
+    print(f'Características recalculadas para {count} livro(s).')
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Rebuild the daily reading rollups used by the analytics endpoints."""
+    count = analytics.rebuild_daily_rollups()
+    print(f'{count} dia(s) de leitura consolidados.')
+    community.rebuild()
+
+
+@app.cli.command('rebuild-community')
+def rebuild_community_command():
+    """Recompute the community totals behind the leaderboards."""
+    count = community.rebuild()
+    print(f'{count} total(is) da comunidade recalculados.')
 
 
 # ============================================
@@ -135,6 +216,24 @@ def logout():
     return jsonify({'message': 'Logout realizado com sucesso!'})
 
 
+@app.route('/api/auth/account', methods=['DELETE'])
+@login_required
+def delete_account():
+    """Delete the current user's account and all of its data."""
+    data = request.get_json(silent=True) or {}
+    
+    if not current_user.check_password(data.get('password', '')):
+        return jsonify({'error': 'Senha incorreta'}), 401
+    
+    user_id = current_user.id
+    logout_user()
+    community.forget_user(user_id)
+    # Books, diary, notes and rollups go with it through ON DELETE CASCADE
+    db.session.execute(delete(User).where(User.id == user_id))
+    db.session.commit()
+    return '', 204
+
+
 @app.route('/api/auth/me', methods=['GET'])
 def get_current_user_info():
     """Get current logged in user info."""
@@ -197,10 +296,110 @@ def notes_page():
     return render_template('notes.html')
 
 
+@app.route('/sw.js')
+def service_worker():
+    """Service worker, served from the root so it controls every page.
+    
+    The asset manifest is prepended so a new build changes the script and
+    the browser installs the new version (and drops the old cache).
+    """
+    with open(os.path.join(app.static_folder, 'sw.js')) as f:
+        script = f.read()
+    manifest = assets.load_manifest(app.static_folder)
+    response = app.response_class(
+        f'self.ASSET_MANIFEST = {json.dumps(manifest)};\n{script}',
+        mimetype='application/javascript'
+    )
+    response.cache_control.no_cache = True
+    return response
+
+
 # ============================================
 # API: Books
 # ============================================
 
+def _parse_text(value):
+    return value if value is None else str(value)
+
+
+def _parse_required_text(value):
+    if value is None or not str(value).strip():
+        raise ValueError('must not be empty')
+    return str(value)
+
+
+def _parse_int(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError('must be an integer')
+    return int(value)
+
+
+def _parse_float(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError('must be a number')
+    return float(value)
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def _parse_rating(value):
+    rating = _parse_int(value)
+    if rating is not None and not 1 <= rating <= 5:
+        raise ValueError('must be between 1 and 5')
+    return rating
+
+
+def _parse_choice(*choices):
+    def parse(value):
+        if value not in choices:
+            raise ValueError(f"must be one of: {', '.join(choices)}")
+        return value
+    return parse
+
+
+# Writable book fields and the parser that validates/converts each of them
+BOOK_FIELDS = {
+    'title': _parse_required_text,
+    'author': _parse_text,
+    'publisher': _parse_text,
+    'genre': _parse_text,
+    'pages': _parse_int,
+    'cover_url': _parse_text,
+    'status': _parse_choice('read', 'reading', 'want_to_read'),
+    'priority': _parse_choice('high', 'normal', 'low'),
+    'purchase_place': _parse_text,
+    'purchase_price': _parse_float,
+    'purchase_date': _parse_date,
+    'delivery_days': _parse_int,
+    'start_date': _parse_date,
+    'end_date': _parse_date,
+    'current_page': _parse_int,
+    'rating': _parse_rating,
+    'observations': _parse_text,
+}
+
+
+def parse_book_fields(data):
+    """Validate and convert the known book fields present in `data`.
+    
+    Unknown keys are ignored. Raises ValueError naming the offending field.
+    """
+    values = {}
+    for field, parse in BOOK_FIELDS.items():
+        if field in data:
+            try:
+                values[field] = parse(data[field])
+            except (TypeError, ValueError) as e:
+                raise ValueError(f'Invalid value for {field}: {e}')
+    return values
+
+
 @app.route('/api/books', methods=['GET'])
 @login_required
 def get_books():
@@ -234,7 +433,7 @@ def get_books():
         )
     
     books = query.order_by(Book.created_at.desc()).all()
-    return jsonify([book.to_dict() for book in books])
+    return compression.jsonify_rows([book.to_dict() for book in books])
 
 
 @app.route('/api/books/<int:book_id>', methods=['GET'])
@@ -249,35 +448,31 @@ def get_book(book_id):
 @login_required
 def create_book():
     """Create a new book."""
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON body'}), 400
     
-    book = Book(
-        user_id=current_user.id,
-        title=data.get('title'),
-        author=data.get('author'),
-        publisher=data.get('publisher'),
-        genre=data.get('genre'),
-        pages=data.get('pages'),
-        cover_url=data.get('cover_url'),
-        status=data.get('status', 'want_to_read'),
-        priority=data.get('priority', 'normal'),
-        purchase_place=data.get('purchase_place'),
-        purchase_price=data.get('purchase_price'),
-        purchase_date=datetime.strptime(data['purchase_date'], '%Y-%m-%d').date() if data.get('purchase_date') else None,
-        delivery_days=data.get('delivery_days'),
-        start_date=datetime.strptime(data['start_date'], '%Y-%m-%d').date() if data.get('start_date') else None,
-        end_date=datetime.strptime(data['end_date'], '%Y-%m-%d').date() if data.get('end_date') else None,
-        current_page=data.get('current_page', 0),
-        rating=data.get('rating'),
-        observations=data.get('observations')
-    )
+    try:
+        values = parse_book_fields({'title': None, **data})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    values.setdefault('status', 'want_to_read')
+    values.setdefault('priority', 'normal')
+    if values.get('current_page') is None:
+        values['current_page'] = 0
+    
+    book = Book(user_id=current_user.id, **values)
     
     # Set queue order for new books
     max_order = db.session.query(func.max(Book.queue_order)).filter_by(user_id=current_user.id).scalar() or 0
     book.queue_order = max_order + 1
     
     db.session.add(book)
+    db.session.flush()
+    recommend.refresh_book_features([book.id])
+    community.refresh_books([book.id])
     db.session.commit()
+    covers.schedule_remote_cover(book.id, book.cover_url)
     
     return jsonify(book.to_dict()), 201
 
@@ -289,56 +484,168 @@ def update_book(book_id):
     book = Book.query.filter_by(id=book_id, user_id=current_user.id).first_or_404()
     data = request.get_json()
     
+    try:
+        values = parse_book_fields(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    cover_changed = 'cover_url' in values and values['cover_url'] != book.cover_url
+    if cover_changed:
+        values['cover_key'] = covers.local_key(values['cover_url'])
+    
     # Update fields if provided
-    if 'title' in data:
-        book.title = data['title']
-    if 'author' in data:
-        book.author = data['author']
-    if 'publisher' in data:
-        book.publisher = data['publisher']
-    if 'genre' in data:
-        book.genre = data['genre']
-    if 'pages' in data:
-        book.pages = data['pages']
-    if 'cover_url' in data:
-        book.cover_url = data['cover_url']
-    if 'status' in data:
-        book.status = data['status']
-    if 'priority' in data:
-        book.priority = data['priority']
-    if 'purchase_place' in data:
-        book.purchase_place = data['purchase_place']
-    if 'purchase_price' in data:
-        book.purchase_price = data['purchase_price']
-    if 'purchase_date' in data:
-        book.purchase_date = datetime.strptime(data['purchase_date'], '%Y-%m-%d').date() if data['purchase_date'] else None
-    if 'delivery_days' in data:
-        book.delivery_days = data['delivery_days']
-    if 'start_date' in data:
-        book.start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').date() if data['start_date'] else None
-    if 'end_date' in data:
-        book.end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date() if data['end_date'] else None
-    if 'current_page' in data:
-        book.current_page = data['current_page']
-    if 'rating' in data:
-        book.rating = data['rating']
-    if 'observations' in data:
-        book.observations = data['observations']
+    for field, value in values.items():
+        setattr(book, field, value)
     
+    if recommend.BOOK_FIELDS & values.keys():
+        recommend.refresh_book_features([book.id])
+    if community.BOOK_FIELDS & values.keys():
+        community.refresh_books([book.id])
     db.session.commit()
+    if cover_changed:
+        covers.schedule_remote_cover(book.id, book.cover_url)
     return jsonify(book.to_dict())
 
 
-@app.route('/api/books/<int:book_id>', methods=['DELETE'])
+@app.route('/api/books/<int:book_id>', methods=['PATCH'])
 @login_required
-def delete_book(book_id):
-    """Delete a book."""
+def patch_book(book_id):
+    """Partially update a book and return only the changed fields.
+    
+    Runs a single UPDATE ... RETURNING instead of loading the row first.
+    Send `Prefer: return=minimal` to get an empty 204 response.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data:
+        return jsonify({'error': 'No fields to update'}), 400
+    
+    unknown = sorted(set(data) - set(BOOK_FIELDS))
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    try:
+        values = parse_book_fields(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    columns = [getattr(Book, field) for field in values] + [Book.updated_at]
+    if 'cover_url' in values:
+        # Not part of the response: the key is internal
+        values['cover_key'] = covers.local_key(values['cover_url'])
+    
+    stmt = update(Book).where(
+        Book.id == book_id,
+        Book.user_id == current_user.id
+    ).values(**values).execution_options(synchronize_session=False)
+    
+    if db.engine.dialect.update_returning:
+        row = db.session.execute(stmt.returning(*columns)).first()
+    else:
+        # SQLite < 3.35 has no RETURNING: read back only the changed columns
+        result = db.session.execute(stmt)
+        row = None
+        if result.rowcount:
+            row = db.session.execute(select(*columns).where(Book.id == book_id)).first()
+    
+    if row is None:
+        db.session.rollback()
+        abort(404)
+    if recommend.BOOK_FIELDS & values.keys():
+        recommend.refresh_book_features([book_id])
+    if community.BOOK_FIELDS & values.keys():
+        community.refresh_books([book_id])
+    db.session.commit()
+    
+    if 'cover_url' in values:
+        covers.schedule_remote_cover(book_id, values['cover_url'])
+    
+    if 'return=minimal' in request.headers.get('Prefer', ''):
+        return '', 204
+    
+    changed = {'id': book_id}
+    for column, value in zip(columns, row):
+        changed[column.key] = value.isoformat() if hasattr(value, 'isoformat') else value
+    return jsonify(changed)
+
+
+@app.route('/api/books/<int:book_id>/cover', methods=['POST'])
+@login_required
+def upload_book_cover(book_id):
+    """Upload a cover image for a book (multipart field `cover`)."""
     book = Book.query.filter_by(id=book_id, user_id=current_user.id).first_or_404()
-    db.session.delete(book)
+    upload = request.files.get('cover')
+    if upload is None:
+        return jsonify({'error': 'No cover file provided'}), 400
+    
+    try:
+        # One byte over the limit is enough for store_cover to reject it
+        key = covers.store_cover(upload.read(app.config['COVER_MAX_BYTES'] + 1))
+    except covers.CoverError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    book.cover_key = key
+    book.cover_url = url_for('cover_image', key=key)
     db.session.commit()
+    covers.schedule_thumbnails(key)
+    return jsonify(book.to_dict())
+
+
+@app.route('/api/books/<int:book_id>', methods=['DELETE'])
+@login_required
+def delete_book(book_id):
+    """Delete a book (its diary entries and notes go with it)."""
+    if not delete_books([book_id]):
+        abort(404)
     return '', 204
 
 
+# Largest id list accepted by POST /api/books/bulk-delete
+BULK_DELETE_MAX = 500
+
+
+@app.route('/api/books/bulk-delete', methods=['POST'])
+@login_required
+def bulk_delete_books():
+    """Delete several books at once."""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({'error': 'ids must be a list of book IDs'}), 400
+    if len(ids) > BULK_DELETE_MAX:
+        return jsonify({'error': f'At most {BULK_DELETE_MAX} books per request'}), 400
+    
+    return jsonify({'deleted': delete_books(ids)})
+
+
+def delete_books(book_ids):
+    """Delete the current user's books with one statement.
+    
+    Diary entries and notes are removed by the database's ON DELETE CASCADE;
+    the daily rollups of the affected days and the community totals are
+    refreshed afterwards.
+    Returns the number of books deleted.
+    """
+    if not book_ids:
+        return 0
+    days = db.session.execute(
+        select(ReadingDiary.date).distinct().where(
+            ReadingDiary.user_id == current_user.id,
+            ReadingDiary.book_id.in_(book_ids)
+        )
+    ).scalars().all()
+    
+    result = db.session.execute(
+        delete(Book).where(
+            Book.id.in_(book_ids),
+            Book.user_id == current_user.id
+        ).execution_options(synchronize_session=False)
+    )
+    analytics.refresh_daily_rollups(current_user.id, days)
+    community.refresh_books(book_ids)
+    db.session.commit()
+    return result.rowcount
+
+
 @app.route('/api/books/current', methods=['GET'])
 @login_required
 def get_current_book():
@@ -356,9 +663,60 @@ def get_current_book():
 @app.route('/api/queue', methods=['GET'])
 @login_required
 def get_queue():
-    """Get reading queue (want_to_read books ordered)."""
+    """Get reading queue (want_to_read books ordered) with finish estimates."""
     books = Book.query.filter_by(user_id=current_user.id, status='want_to_read').order_by(Book.queue_order).all()
-    return jsonify([book.to_dict() for book in books])
+    _, estimates = forecast.forecast_books(current_user.id)
+    return compression.jsonify_rows([dict(book.to_dict(), forecast=estimates.get(book.id)) for book in books])
+
+
+@app.route('/api/forecast', methods=['GET'])
+@login_required
+def get_forecast():
+    """Get the reading pace and projected finish dates for current and queued books."""
+    pace, estimates = forecast.forecast_books(current_user.id)
+    return jsonify({
+        'pace': pace,
+        'books': [dict(book_id=book_id, **estimate) for book_id, estimate in estimates.items()]
+    })
+
+
+@app.route('/api/queue/suggested', methods=['GET'])
+@login_required
+def get_suggested_queue():
+    """Get the queue ranked by similarity to the user's rated books.
+    
+    Send the returned ids to PUT /api/queue/reorder to adopt the order.
+    """
+    ranking = recommend.suggested_queue(current_user.id)
+    similar_ids = {closest for _, _, closest in ranking if closest}
+    titles = dict(db.session.execute(
+        select(Book.id, Book.title).where(Book.id.in_(similar_ids))
+    ).all()) if similar_ids else {}
+    queued = {
+        book.id: book for book in db.session.execute(
+            select(Book.id, Book.title, Book.author, Book.queue_order).where(
+                Book.user_id == current_user.id,
+                Book.status == 'want_to_read'
+            )
+        )
+    }
+    # Books without a feature row yet (until init-db fills them in) go last
+    unranked = set(queued) - {book_id for book_id, _, _ in ranking}
+    ranking = ranking + [
+        (book_id, 0.0, None) for book_id in sorted(unranked, key=lambda i: queued[i].queue_order or 0)
+    ]
+    return compression.jsonify_rows([
+        {
+            'id': book_id,
+            'title': queued[book_id].title,
+            'author': queued[book_id].author,
+            'queue_order': queued[book_id].queue_order,
+            'score': score,
+            'similar_to': closest,
+            'similar_to_title': titles.get(closest)
+        }
+        for book_id, score, closest in ranking if book_id in queued
+    ])
 
 
 @app.route('/api/queue/reorder', methods=['PUT'])
@@ -399,16 +757,93 @@ def get_diary():
     month = request.args.get('month')
     year = request.args.get('year')
     
-    query = ReadingDiary.query.filter_by(user_id=current_user.id)
+    query = ReadingDiary.query.options(joinedload(ReadingDiary.book)).filter_by(user_id=current_user.id)
     
     if month and year:
-        query = query.filter(
-            db.extract('month', ReadingDiary.date) == int(month),
-            db.extract('year', ReadingDiary.date) == int(year)
-        )
+        try:
+            start, end = month_range(int(year), int(month))
+        except ValueError:
+            return jsonify({'error': 'Invalid month or year'}), 400
+        query = query.filter(ReadingDiary.date >= start, ReadingDiary.date < end)
     
     entries = query.order_by(ReadingDiary.date.desc()).all()
-    return jsonify([entry.to_dict() for entry in entries])
+    return compression.jsonify_rows([entry.to_dict() for entry in entries])
+
+
+@app.route('/api/diary/calendar', methods=['GET'])
+@login_required
+def get_diary_calendar():
+    """Get a compact per-day reading calendar for a date range.
+    
+    Accepts `from`/`to` (inclusive, YYYY-MM-DD), `month` (YYYY-MM) or
+    `week` (ISO week, YYYY-Www). Only days with a diary entry are listed.
+    """
+    try:
+        start, end = parse_calendar_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rows = db.session.query(
+        ReadingDiary.date,
+        ReadingDiary.pages_read,
+        ReadingDiary.reading_time,
+        ReadingDiary.did_read
+    ).filter(
+        ReadingDiary.user_id == current_user.id,
+        ReadingDiary.date >= start,
+        ReadingDiary.date < end
+    ).order_by(ReadingDiary.date).all()
+    
+    return jsonify({
+        'from': start.isoformat(),
+        'to': (end - timedelta(days=1)).isoformat(),
+        'fields': ['date', 'pages', 'minutes', 'did_read'],
+        'days': [
+            [d.isoformat(), pages or 0, minutes or 0, bool(did_read)]
+            for d, pages, minutes, did_read in rows
+        ]
+    })
+
+
+# Longest range a single calendar request may cover
+CALENDAR_MAX_DAYS = 366 * 10
+
+
+def month_range(year, month):
+    """Return the half-open [start, end) date range of a month."""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def parse_calendar_range(args):
+    """Turn calendar query args into a half-open [start, end) date range."""
+    try:
+        return _calendar_range(args)
+    except OverflowError:
+        # The day after the range's last one is past date.max
+        raise ValueError('Date out of range')
+
+
+def _calendar_range(args):
+    if args.get('week'):
+        year, week = args['week'].split('-W')
+        start = date.fromisocalendar(int(year), int(week), 1)
+        return start, start + timedelta(days=7)
+    
+    if args.get('month'):
+        year, month = args['month'].split('-')
+        return month_range(int(year), int(month))
+    
+    if not args.get('from') or not args.get('to'):
+        raise ValueError('Provide from/to, month or week')
+    start = datetime.strptime(args['from'], '%Y-%m-%d').date()
+    end = datetime.strptime(args['to'], '%Y-%m-%d').date() + timedelta(days=1)
+    if end <= start:
+        raise ValueError('"to" must not be before "from"')
+    if (end - start).days > CALENDAR_MAX_DAYS:
+        raise ValueError(f'Range is limited to {CALENDAR_MAX_DAYS} days')
+    return start, end
 
 
 @app.route('/api/diary/<string:date_str>', methods=['GET'])
@@ -451,6 +886,9 @@ def create_diary_entry():
     )
     
     db.session.add(entry)
+    db.session.flush()
+    apply_reading_progress(current_user.id, entry.book_id, entry.pages_read)
+    analytics.refresh_daily_rollup(current_user.id, entry.date)
     db.session.commit()
     
     return jsonify(entry.to_dict()), 201
@@ -462,6 +900,7 @@ def update_diary_entry(entry_id):
     """Update a diary entry."""
     entry = ReadingDiary.query.filter_by(id=entry_id, user_id=current_user.id).first_or_404()
     data = request.get_json()
+    old_book_id, old_pages = entry.book_id, entry.pages_read or 0
     
     if 'book_id' in data:
         entry.book_id = data['book_id']
@@ -476,6 +915,14 @@ def update_diary_entry(entry_id):
     if 'notes' in data:
         entry.notes = data['notes']
     
+    db.session.flush()
+    new_pages = entry.pages_read or 0
+    if entry.book_id == old_book_id:
+        apply_reading_progress(current_user.id, entry.book_id, new_pages - old_pages)
+    else:
+        apply_reading_progress(current_user.id, old_book_id, -old_pages)
+        apply_reading_progress(current_user.id, entry.book_id, new_pages)
+    analytics.refresh_daily_rollup(current_user.id, entry.date)
     db.session.commit()
     return jsonify(entry.to_dict())
 
@@ -485,7 +932,11 @@ def update_diary_entry(entry_id):
 def delete_diary_entry(entry_id):
     """Delete a diary entry."""
     entry = ReadingDiary.query.filter_by(id=entry_id, user_id=current_user.id).first_or_404()
+    book_id, pages, entry_date = entry.book_id, entry.pages_read or 0, entry.date
     db.session.delete(entry)
+    db.session.flush()
+    apply_reading_progress(current_user.id, book_id, -pages)
+    analytics.refresh_daily_rollup(current_user.id, entry_date)
     db.session.commit()
     return '', 204
 
@@ -498,31 +949,36 @@ def delete_diary_entry(entry_id):
 @login_required
 def get_stats_overview():
     """Get dashboard overview statistics."""
-    total_books = Book.query.filter_by(user_id=current_user.id).count()
-    books_read = Book.query.filter_by(user_id=current_user.id, status='read').count()
-    books_reading = Book.query.filter_by(user_id=current_user.id, status='reading').count()
-    books_want = Book.query.filter_by(user_id=current_user.id, status='want_to_read').count()
+    return jsonify(overview_stats(current_user.id))
+
+
+def overview_stats(user_id):
+    """Dashboard overview statistics of a user."""
+    total_books = Book.query.filter_by(user_id=user_id).count()
+    books_read = Book.query.filter_by(user_id=user_id, status='read').count()
+    books_reading = Book.query.filter_by(user_id=user_id, status='reading').count()
+    books_want = Book.query.filter_by(user_id=user_id, status='want_to_read').count()
     
     # Pages read today
     today = date.today()
-    today_entry = ReadingDiary.query.filter_by(user_id=current_user.id, date=today).first()
+    today_entry = ReadingDiary.query.filter_by(user_id=user_id, date=today).first()
     pages_today = today_entry.pages_read if today_entry else 0
     
     # Average pages per day (last 30 days)
     thirty_days_ago = today - timedelta(days=30)
     avg_pages = db.session.query(func.avg(ReadingDiary.pages_read)).filter(
-        ReadingDiary.user_id == current_user.id,
+        ReadingDiary.user_id == user_id,
         ReadingDiary.date >= thirty_days_ago,
         ReadingDiary.did_read == True
     ).scalar() or 0
     
     # Reading streak
-    streak = calculate_streak()
+    streak = calculate_streak(user_id)
     
     # Current book
-    current_book = Book.query.filter_by(user_id=current_user.id, status='reading').first()
+    current_book = Book.query.filter_by(user_id=user_id, status='reading').first()
     
-    return jsonify({
+    return {
         'total_books': total_books,
         'books_read': books_read,
         'books_reading': books_reading,
@@ -531,17 +987,17 @@ def get_stats_overview():
         'avg_pages_day': round(avg_pages, 1),
         'streak': streak,
         'current_book': current_book.to_dict() if current_book else None
-    })
+    }
 
 
-def calculate_streak():
+def calculate_streak(user_id):
     """Calculate current reading streak."""
     today = date.today()
     streak = 0
     current_date = today
     
     while True:
-        entry = ReadingDiary.query.filter_by(user_id=current_user.id, date=current_date, did_read=True).first()
+        entry = ReadingDiary.query.filter_by(user_id=user_id, date=current_date, did_read=True).first()
         if entry:
             streak += 1
             current_date -= timedelta(days=1)
@@ -689,6 +1145,117 @@ def get_reading_time_stats():
     })
 
 
+@app.route('/api/stats/heatmap', methods=['GET'])
+@login_required
+def get_heatmap_stats():
+    """Get pages per day for a reading heatmap (defaults to the last year)."""
+    try:
+        start, end = _analytics_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'from': start.isoformat(),
+        'to': (end - timedelta(days=1)).isoformat(),
+        'days': analytics.heatmap(current_user.id, start, end)
+    })
+
+
+@app.route('/api/stats/weekdays', methods=['GET'])
+@login_required
+def get_weekday_stats():
+    """Get pages and minutes read by weekday."""
+    try:
+        start, end = _analytics_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(analytics.weekday_distribution(current_user.id, start, end))
+
+
+@app.route('/api/stats/moving-average', methods=['GET'])
+@login_required
+def get_moving_average_stats():
+    """Get daily pages with a trailing moving average (`window` days)."""
+    try:
+        start, end = _analytics_range(request.args)
+        window = int(request.args.get('window', 7))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not 1 <= window <= 365:
+        return jsonify({'error': 'window must be between 1 and 365'}), 400
+    
+    return jsonify(analytics.moving_average(current_user.id, start, end, window))
+
+
+@app.route('/api/stats/year-in-review', methods=['GET'])
+@login_required
+def get_year_in_review():
+    """Get the year-in-review summary (defaults to the current year)."""
+    try:
+        year = int(request.args.get('year', date.today().year))
+    except ValueError:
+        return jsonify({'error': 'Invalid year'}), 400
+    # The year's end (January 1st of the next one) must be a valid date
+    if not 1 <= year <= date.max.year - 1:
+        return jsonify({'error': f'year must be between 1 and {date.max.year - 1}'}), 400
+    
+    return jsonify(analytics.year_in_review(current_user.id, year))
+
+
+@app.route('/api/stats/rebuild', methods=['POST'])
+@login_required
+def rebuild_stats():
+    """Recompute the user's rollups and progress counters in the background."""
+    job = jobs.enqueue(
+        'rebuild-stats', {'user_id': current_user.id},
+        user_id=current_user.id, dedup_key=f'rebuild-stats:{current_user.id}'
+    )
+    return _job_response(job, 202)
+
+
+@jobs.task('rebuild-stats')
+def rebuild_stats_job(user_id):
+    """Job: rebuild one user's daily rollups and book progress counters."""
+    return {
+        'days': analytics.rebuild_daily_rollups(user_id),
+        'books': repair_reading_progress(user_id)
+    }
+
+
+def _analytics_range(args):
+    """Calendar-style range from the query args, or the last 365 days."""
+    if any(args.get(key) for key in ('from', 'to', 'month', 'week')):
+        return parse_calendar_range(args)
+    end = date.today() + timedelta(days=1)
+    return end - timedelta(days=365), end
+
+
+# ============================================
+# API: Community
+# ============================================
+
+@app.route('/api/community', methods=['GET'])
+@login_required
+def get_community_stats():
+    """Get reading totals and most-read authors/genres across all users.
+    
+    `month` (YYYY-MM, default: current month) and `limit` (1-50) are optional.
+    Served from the community summary, which the job workers refresh
+    every COMMUNITY_COMPACT_INTERVAL seconds.
+    """
+    month = request.args.get('month') or date.today().strftime('%Y-%m')
+    try:
+        month = datetime.strptime(month, '%Y-%m').strftime('%Y-%m')
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'Invalid month or limit'}), 400
+    if not 1 <= limit <= 50:
+        return jsonify({'error': 'limit must be between 1 and 50'}), 400
+    
+    return jsonify(community.leaderboard(month, limit))
+
+
 # ============================================
 # API: Notes
 # ============================================
@@ -700,7 +1267,7 @@ def get_notes():
     note_type = request.args.get('type')
     book_id = request.args.get('book_id')
     
-    query = Note.query.filter_by(user_id=current_user.id)
+    query = Note.query.options(joinedload(Note.book)).filter_by(user_id=current_user.id)
     
     if note_type:
         query = query.filter(Note.type == note_type)
@@ -708,7 +1275,7 @@ def get_notes():
         query = query.filter(Note.book_id == int(book_id))
     
     notes = query.order_by(Note.created_at.desc()).all()
-    return jsonify([note.to_dict() for note in notes])
+    return compression.jsonify_rows([note.to_dict() for note in notes])
 
 
 @app.route('/api/notes/book/<int:book_id>', methods=['GET'])
@@ -734,6 +1301,8 @@ def create_note():
     )
     
     db.session.add(note)
+    db.session.flush()
+    recommend.refresh_book_features([note.book_id])
     db.session.commit()
     
     return jsonify(note.to_dict()), 201
@@ -753,6 +1322,8 @@ def update_note(note_id):
     if 'page_number' in data:
         note.page_number = data['page_number']
     
+    if 'content' in data:
+        recommend.refresh_book_features([note.book_id])
     db.session.commit()
     return jsonify(note.to_dict())
 
@@ -763,6 +1334,8 @@ def delete_note(note_id):
     """Delete a note."""
     note = Note.query.filter_by(id=note_id, user_id=current_user.id).first_or_404()
     db.session.delete(note)
+    db.session.flush()
+    recommend.refresh_book_features([note.book_id])
     db.session.commit()
     return '', 204
 
@@ -771,34 +1344,149 @@ def delete_note(note_id):
 # API: Quotes
 # ============================================
 
+# The quotes only change when seeded, so each worker keeps them in memory
+_quote_cache = {'quotes': [], 'expires': 0}
+
+
+def cached_quotes():
+    """All quotes as dicts, reloaded every QUOTE_CACHE_SECONDS."""
+    if time.monotonic() >= _quote_cache['expires']:
+        _quote_cache['quotes'] = [quote.to_dict() for quote in DailyQuote.query.all()]
+        _quote_cache['expires'] = time.monotonic() + app.config['QUOTE_CACHE_SECONDS']
+    return _quote_cache['quotes']
+
+
 @app.route('/api/quote', methods=['GET'])
 def get_random_quote():
     """Get a random literary quote."""
-    quotes = DailyQuote.query.all()
+    quotes = cached_quotes()
     if quotes:
-        quote = random.choice(quotes)
-        return jsonify(quote.to_dict())
+        return jsonify(random.choice(quotes))
     return jsonify(None)
 
 
+@health.warm_up_step
+def check_schema():
+    """Stay unready on a database older than the models."""
+    outdated = outdated_tables(db.engine)
+    if outdated:
+        raise RuntimeError(
+            f"Outdated tables ({', '.join(outdated)}): run `flask --app app init-db`"
+        )
+
+
+@health.warm_up_step
+def warm_up_caches():
+    """Load the quotes and compile the dashboard's statements."""
+    cached_quotes()
+    # No user has id 0: the queries are cheap but still compiled and planned
+    overview_stats(0)
+
+
 # ============================================
 # API: Export
 # ============================================
 
+def _export_queries(user_id):
+    """(key, query) pairs making up a user's export, in document order."""
+    return [
+        ('books', Book.query.filter_by(user_id=user_id).order_by(Book.id)),
+        ('diary', ReadingDiary.query.options(joinedload(ReadingDiary.book))
+            .filter_by(user_id=user_id).order_by(ReadingDiary.id)),
+        ('notes', Note.query.options(joinedload(Note.book))
+            .filter_by(user_id=user_id).order_by(Note.id)),
+    ]
+
+
 @app.route('/api/export', methods=['GET'])
 @login_required
 def export_data():
-    """Export all data as JSON."""
-    books = [book.to_dict() for book in Book.query.filter_by(user_id=current_user.id).all()]
-    diary = [entry.to_dict() for entry in ReadingDiary.query.filter_by(user_id=current_user.id).all()]
-    notes = [note.to_dict() for note in Note.query.filter_by(user_id=current_user.id).all()]
+    """Export all data as JSON, streamed so large libraries never sit in memory."""
+    user_id = current_user.id
     
-    return jsonify({
-        'books': books,
-        'diary': diary,
-        'notes': notes,
-        'exported_at': datetime.utcnow().isoformat()
-    })
+    def generate():
+        for index, (key, query) in enumerate(_export_queries(user_id)):
+            yield ('{' if index == 0 else ', ') + f'"{key}": '
+            yield from _json_array(query)
+        yield f', "exported_at": {json.dumps(datetime.utcnow().isoformat())}}}'
+    
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+
+@app.route('/api/export', methods=['POST'])
+@login_required
+def start_export():
+    """Build the export in a background job; poll the returned job for it."""
+    job = jobs.enqueue(
+        'export', {'user_id': current_user.id},
+        user_id=current_user.id, dedup_key=f'export:{current_user.id}'
+    )
+    return _job_response(job, 202)
+
+
+@jobs.task('export')
+def export_job(user_id):
+    """Job: the same document as GET /api/export."""
+    document = {
+        key: [item.to_dict() for item in query.yield_per(EXPORT_BATCH_SIZE)]
+        for key, query in _export_queries(user_id)
+    }
+    document['exported_at'] = datetime.utcnow().isoformat()
+    return document
+
+
+# Rows fetched per round-trip while streaming an export
+EXPORT_BATCH_SIZE = 500
+
+
+def _json_array(query):
+    """Yield a query's rows as a JSON array, one batch at a time."""
+    yield '['
+    for index, item in enumerate(query.yield_per(EXPORT_BATCH_SIZE)):
+        yield (',' if index else '') + json.dumps(item.to_dict())
+    yield ']'
+
+
+# ============================================
+# API: Jobs
+# ============================================
+
+def _job_response(job, status=200):
+    data = job.to_dict()
+    data['url'] = url_for('get_job', job_id=job.id)
+    if job.status == 'done':
+        data['result_url'] = url_for('get_job_result', job_id=job.id)
+    response = jsonify(data)
+    response.status_code = status
+    if status == 202:
+        response.headers['Location'] = data['url']
+    return response
+
+
+@app.route('/api/jobs', methods=['GET'])
+@login_required
+def get_jobs():
+    """Get the user's most recent background jobs."""
+    user_jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.id.desc()).limit(20)
+    return jsonify([job.to_dict() for job in user_jobs])
+
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """Get a background job's status."""
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    return _job_response(job)
+
+
+@app.route('/api/jobs/<int:job_id>/result', methods=['GET'])
+@login_required
+def get_job_result(job_id):
+    """Get a finished job's result."""
+    job = Job.query.filter_by(id=job_id, user_id=current_user.id).first_or_404()
+    if job.status != 'done':
+        return jsonify({'error': f'Job is {job.status}'}), 409
+    return app.response_class(job.result, mimetype='application/json')
 
 
 # ============================================
@@ -835,4 +1523,8 @@ def get_filters():
 
 
 if __name__ == '__main__':
+    # Local development: prepare the database before serving
+    with app.app_context():
+        init_database()
+        init_quotes(db)
     app.run(debug=True, port=5000)
@@ -0,0 +1,13 @@
+"""ASGI entry point, for serving under an ASGI server such as uvicorn.
+
+    pip install asgiref uvicorn
+    uvicorn asgi:app --workers 2
+
+The Flask app stays synchronous: asgiref runs each request in a thread pool,
+so the pool size in Config (WEB_THREADS / DB_POOL_SIZE) still applies.
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as wsgi_app
+
+app = WsgiToAsgi(wsgi_app)
@@ -0,0 +1,128 @@
+"""Fingerprinted, precompressed static assets.
+
+`flask --app app build-assets` copies each static file to
+`static/dist/<name>.<hash><ext>`, writes gzip (and, when the `brotli`
+package is installed, brotli) variants of the text assets, and records the
+mapping in `static/dist/assets.json`. Once that manifest exists,
+`url_for('static', filename=...)` emits the fingerprinted URL, which is
+served with the best precompressed variant and an immutable Cache-Control.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are written without it
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'assets.json'
+# Served under fixed URLs (PWA manifest, service worker) or user content
+EXCLUDED = {'manifest.json', 'sw.js'}
+EXCLUDED_DIRS = {DIST_DIR, 'uploads'}
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.txt', '.html', '.map'}
+HASH_LENGTH = 10
+ONE_YEAR = 365 * 24 * 60 * 60
+
+_manifest_cache = {}
+
+
+def _source_files(static_folder):
+    for root, dirs, files in os.walk(static_folder):
+        rel_root = os.path.relpath(root, static_folder)
+        if rel_root == '.':
+            dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+        for name in sorted(files):
+            rel_path = os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, '/')
+            if rel_path not in EXCLUDED:
+                yield rel_path
+
+
+def build_assets(static_folder):
+    """Write fingerprinted and precompressed copies of the static files.
+
+    Returns the manifest that was written.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    files = {}
+    for rel_path in _source_files(static_folder):
+        with open(os.path.join(static_folder, rel_path), 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+        stem, ext = os.path.splitext(rel_path)
+        hashed = f'{stem}.{digest}{ext}'
+
+        target = os.path.join(dist, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+        if ext in COMPRESSIBLE:
+            with open(target + '.gz', 'wb') as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(target + '.br', 'wb') as f:
+                    f.write(brotli.compress(content, quality=11))
+        files[rel_path] = f'{DIST_DIR}/{hashed}'
+
+    version = hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()[:HASH_LENGTH]
+    manifest = {'version': version, 'files': files}
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    _manifest_cache.clear()
+    return manifest
+
+
+def load_manifest(static_folder):
+    """The asset manifest, or an empty one when the build step was not run."""
+    if static_folder not in _manifest_cache:
+        path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+        try:
+            with open(path) as f:
+                _manifest_cache[static_folder] = json.load(f)
+        except FileNotFoundError:
+            _manifest_cache[static_folder] = {'version': 'dev', 'files': {}}
+    return _manifest_cache[static_folder]
+
+
+def init_app(app):
+    """Route static URLs through the manifest and serve the built files."""
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            files = load_manifest(app.static_folder)['files']
+            values['filename'] = files.get(values['filename'], values['filename'])
+
+    @app.route(f'{app.static_url_path}/{DIST_DIR}/<path:filename>')
+    def static_dist(filename):
+        """Serve a fingerprinted asset, precompressed when the client allows."""
+        dist = os.path.join(app.static_folder, DIST_DIR)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        immutable = filename != MANIFEST_NAME
+        max_age = ONE_YEAR if immutable else None
+
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encoding in request.accept_encodings and os.path.isfile(os.path.join(dist, filename + suffix)):
+                response = send_from_directory(dist, filename + suffix, mimetype=mimetype, max_age=max_age)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(dist, filename, mimetype=mimetype, max_age=max_age)
+
+        response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.immutable = True
+        return response
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Write fingerprinted, precompressed static assets."""
+        manifest = build_assets(app.static_folder)
+        print(f"{len(manifest['files'])} arquivo(s) gerados (versão {manifest['version']}).")
@@ -0,0 +1,365 @@
+"""Community leaderboards: reading totals across all users.
+
+Every other query in the app reads one user's rows; a leaderboard would have
+to scan every library. It reads `community_stats` instead: one row per
+period (a month, `YYYY-MM`, or 'all') and kind ('author', 'genre' or
+'total'), ranked through an index, so its cost does not grow with the
+number of users.
+
+The summary is maintained incrementally, never recomputed on a request:
+
+- `community_book_facts` remembers what each finished book contributed
+  (author, genre, pages, month). `refresh_books()` compares it with the
+  book's current row after every book write.
+- The rollup refresh in analytics.py compares the user's monthly reading
+  totals before and after a diary write (`reading_snapshot()`).
+- Differences go to `community_deltas`, an insert-only log, so concurrent
+  writers never wait on the same summary row.
+- `compact()` runs in the job workers every COMMUNITY_COMPACT_INTERVAL
+  seconds and folds the log into `community_stats`.
+
+Leaderboards therefore trail writes by up to the compaction interval.
+`flask --app app rebuild-community` recomputes all three tables.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+import jobs
+from models import db, Book, CommunityBookFact, CommunityDelta, CommunityStat, DailyReadingRollup
+
+ALL_TIME = 'all'
+# Book columns a book's contribution is derived from
+BOOK_FIELDS = {'status', 'end_date', 'author', 'genre', 'pages'}
+METRICS = ('books', 'pages', 'minutes', 'readers')
+# Deltas folded per compaction transaction
+COMPACT_BATCH = 1000
+
+FACT_COLUMNS = (
+    CommunityBookFact.book_id, CommunityBookFact.user_id, CommunityBookFact.author,
+    CommunityBookFact.genre, CommunityBookFact.pages, CommunityBookFact.finished_month
+)
+
+
+def _month(day):
+    return f'{day.year:04d}-{day.month:02d}'
+
+
+def _month_range(month):
+    """[start, end) dates of a `YYYY-MM` month."""
+    year, number = int(month[:4]), int(month[5:])
+    return date(year, number, 1), date(year + number // 12, number % 12 + 1, 1)
+
+
+def _label(value, length):
+    """Display form of an author or genre: trimmed, single-spaced."""
+    return ' '.join((value or '').split())[:length] or None
+
+
+def _add(changes, period, kind, key, label, sign=1, **metrics):
+    """Accumulate metric changes for one community_stats row."""
+    row = changes.setdefault((period, kind, key), dict(label=label, **dict.fromkeys(METRICS, 0)))
+    for name, value in metrics.items():
+        row[name] += sign * (value or 0)
+
+
+def _append(changes):
+    """Write the non-empty changes to the delta log."""
+    rows = [
+        dict(period=period, kind=kind, key=key, **values)
+        for (period, kind, key), values in changes.items()
+        if any(values[name] for name in METRICS)
+    ]
+    if rows:
+        db.session.execute(insert(CommunityDelta), rows)
+
+
+# ============================================
+# Books
+# ============================================
+
+def _fact(book):
+    """Facts row of a book, or None while it is not finished."""
+    if book.status != 'read' or book.end_date is None:
+        return None
+    return {
+        'book_id': book.id,
+        'user_id': book.user_id,
+        'author': _label(book.author, 100),
+        'genre': _label(book.genre, 50),
+        'pages': book.pages or 0,
+        'finished_month': _month(book.end_date)
+    }
+
+
+def _book_changes(changes, fact, sign):
+    """Add (sign=1) or remove (sign=-1) what a finished book contributes."""
+    for period in (fact['finished_month'], ALL_TIME):
+        _add(changes, period, 'total', '', '', sign, books=1)
+        for kind in ('author', 'genre'):
+            if fact[kind]:
+                _add(changes, period, kind, fact[kind].casefold(), fact[kind], sign,
+                     books=1, pages=fact['pages'])
+
+
+def _book_rows(condition):
+    return select(
+        Book.id, Book.user_id, Book.author, Book.genre, Book.pages, Book.status, Book.end_date
+    ).where(condition)
+
+
+def refresh_books(book_ids):
+    """Record how some books' contributions changed.
+
+    Call after flushing a book write or delete, inside the same transaction.
+    """
+    book_ids = sorted({book_id for book_id in book_ids if book_id is not None})
+    if not book_ids:
+        return
+    old = {
+        row.book_id: row._asdict()
+        for row in db.session.execute(select(*FACT_COLUMNS).where(CommunityBookFact.book_id.in_(book_ids)))
+    }
+    new = {}
+    for book in db.session.execute(_book_rows(Book.id.in_(book_ids))):
+        fact = _fact(book)
+        if fact:
+            new[book.id] = fact
+
+    changed = [book_id for book_id in book_ids if old.get(book_id) != new.get(book_id)]
+    if not changed:
+        return
+    changes = {}
+    for book_id in changed:
+        if book_id in old:
+            _book_changes(changes, old[book_id], -1)
+        if book_id in new:
+            _book_changes(changes, new[book_id], 1)
+    db.session.execute(delete(CommunityBookFact).where(CommunityBookFact.book_id.in_(changed)))
+    facts = [new[book_id] for book_id in changed if book_id in new]
+    if facts:
+        db.session.execute(insert(CommunityBookFact), facts)
+    _append(changes)
+
+
+# ============================================
+# Reading
+# ============================================
+
+def _is_reader(totals):
+    pages, minutes = totals
+    return pages > 0 or minutes > 0
+
+
+def reading_snapshot(user_id, days=None):
+    """The user's (pages, minutes) per month touched by `days` (every month if None)."""
+    query = select(
+        DailyReadingRollup.date, DailyReadingRollup.pages, DailyReadingRollup.minutes
+    ).where(DailyReadingRollup.user_id == user_id)
+    months = defaultdict(lambda: (0, 0))
+    if days is not None:
+        ranges = [_month_range(month) for month in sorted({_month(d) for d in days})]
+        if not ranges:
+            return {'months': {}, 'reader': None}
+        query = query.where(or_(*(
+            and_(DailyReadingRollup.date >= start, DailyReadingRollup.date < end) for start, end in ranges
+        )))
+        for start, _ in ranges:
+            months[_month(start)] = (0, 0)
+
+    for day, pages, minutes in db.session.execute(query):
+        month_pages, month_minutes = months[_month(day)]
+        months[_month(day)] = (month_pages + pages, month_minutes + minutes)
+
+    if days is None:
+        reader = any(_is_reader(totals) for totals in months.values())
+    else:
+        reader = db.session.scalar(
+            select(DailyReadingRollup.user_id).where(
+                DailyReadingRollup.user_id == user_id,
+                or_(DailyReadingRollup.pages > 0, DailyReadingRollup.minutes > 0)
+            ).limit(1)
+        ) is not None
+    return {'months': dict(months), 'reader': reader}
+
+
+def _reading_changes(changes, before, after):
+    for month in set(before['months']) | set(after['months']):
+        old = before['months'].get(month, (0, 0))
+        new = after['months'].get(month, (0, 0))
+        pages, minutes = new[0] - old[0], new[1] - old[1]
+        readers = _is_reader(new) - _is_reader(old)
+        _add(changes, month, 'total', '', '', pages=pages, minutes=minutes, readers=readers)
+        _add(changes, ALL_TIME, 'total', '', '', pages=pages, minutes=minutes)
+    if before['reader'] is not None and after['reader'] is not None:
+        _add(changes, ALL_TIME, 'total', '', '', readers=after['reader'] - before['reader'])
+
+
+def record_reading(user_id, days, before):
+    """Record the change since `reading_snapshot(user_id, days)` returned `before`.
+
+    Call after refreshing the user's rollups, inside the same transaction.
+    """
+    changes = {}
+    _reading_changes(changes, before, reading_snapshot(user_id, days))
+    _append(changes)
+
+
+def forget_user(user_id):
+    """Remove a user's contributions. Call before deleting the account."""
+    changes = {}
+    for row in db.session.execute(select(*FACT_COLUMNS).where(CommunityBookFact.user_id == user_id)):
+        _book_changes(changes, row._asdict(), -1)
+    _reading_changes(changes, reading_snapshot(user_id), {'months': {}, 'reader': False})
+    db.session.execute(delete(CommunityBookFact).where(CommunityBookFact.user_id == user_id))
+    _append(changes)
+
+
+# ============================================
+# Compaction
+# ============================================
+
+def _apply(changes, now):
+    """Add accumulated changes to the community_stats rows."""
+    for (period, kind, key), values in changes.items():
+        metrics = {name: values[name] for name in METRICS}
+        updated = db.session.execute(
+            update(CommunityStat).where(
+                CommunityStat.period == period,
+                CommunityStat.kind == kind,
+                CommunityStat.key == key
+            ).values(
+                updated_at=now,
+                **{name: getattr(CommunityStat, name) + value for name, value in metrics.items()}
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            db.session.execute(insert(CommunityStat).values(
+                period=period, kind=kind, key=key, label=values['label'], updated_at=now, **metrics
+            ))
+
+
+@jobs.periodic('COMMUNITY_COMPACT_INTERVAL')
+def compact():
+    """Fold the delta log into community_stats. Returns the number of deltas folded."""
+    folded = 0
+    while True:
+        deltas = db.session.execute(
+            select(CommunityDelta).order_by(CommunityDelta.id).limit(COMPACT_BATCH)
+        ).scalars().all()
+        if not deltas:
+            return folded
+        ids = [delta.id for delta in deltas]
+        # Claim the batch: if another compaction deleted some of it first,
+        # leave the rest to the next run instead of counting it twice
+        claimed = db.session.execute(
+            delete(CommunityDelta).where(CommunityDelta.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed != len(ids):
+            db.session.rollback()
+            return folded
+
+        changes = {}
+        for delta in deltas:
+            _add(changes, delta.period, delta.kind, delta.key, delta.label,
+                 **{name: getattr(delta, name) for name in METRICS})
+        try:
+            _apply(changes, datetime.utcnow())
+            db.session.commit()
+        except IntegrityError:
+            # Another compaction inserted one of the rows: retry next run
+            db.session.rollback()
+            return folded
+        folded += len(ids)
+
+
+def rebuild():
+    """Recompute the community tables from the books and rollups.
+
+    Returns the number of community_stats rows.
+    """
+    changes = {}
+    facts = []
+    for book in db.session.execute(
+        _book_rows(and_(Book.status == 'read', Book.end_date.isnot(None)))
+        .execution_options(yield_per=1000)
+    ):
+        fact = _fact(book)
+        facts.append(fact)
+        _book_changes(changes, fact, 1)
+
+    readers = defaultdict(set)
+    for user_id, day, pages, minutes in db.session.execute(
+        select(
+            DailyReadingRollup.user_id, DailyReadingRollup.date,
+            DailyReadingRollup.pages, DailyReadingRollup.minutes
+        ).execution_options(yield_per=5000)
+    ):
+        for period in (_month(day), ALL_TIME):
+            _add(changes, period, 'total', '', '', pages=pages, minutes=minutes)
+            if pages > 0 or minutes > 0:
+                readers[period].add(user_id)
+    for period, users in readers.items():
+        _add(changes, period, 'total', '', '', readers=len(users))
+
+    db.session.execute(delete(CommunityDelta))
+    db.session.execute(delete(CommunityBookFact))
+    db.session.execute(delete(CommunityStat))
+    for start in range(0, len(facts), 1000):
+        db.session.execute(insert(CommunityBookFact), facts[start:start + 1000])
+    now = datetime.utcnow()
+    rows = [
+        dict(period=period, kind=kind, key=key, updated_at=now, **values)
+        for (period, kind, key), values in changes.items()
+    ]
+    for start in range(0, len(rows), 1000):
+        db.session.execute(insert(CommunityStat), rows[start:start + 1000])
+    db.session.commit()
+    return len(rows)
+
+
+# ============================================
+# Queries
+# ============================================
+
+def _top(kind, period, limit):
+    rows = db.session.execute(
+        select(CommunityStat.label, CommunityStat.books, CommunityStat.pages).where(
+            CommunityStat.kind == kind,
+            CommunityStat.period == period,
+            CommunityStat.books > 0
+        ).order_by(CommunityStat.books.desc(), CommunityStat.pages.desc(), CommunityStat.label).limit(limit)
+    ).all()
+    return [{kind: label, 'books': books, 'pages': pages} for label, books, pages in rows]
+
+
+def _totals(month):
+    rows = {
+        period: row for period, *row in db.session.execute(
+            select(
+                CommunityStat.period, CommunityStat.books, CommunityStat.pages,
+                CommunityStat.minutes, CommunityStat.readers
+            ).where(
+                CommunityStat.kind == 'total',
+                CommunityStat.key == '',
+                CommunityStat.period.in_((month, ALL_TIME))
+            )
+        )
+    }
+
+    def totals(period):
+        books, pages, minutes, readers = rows.get(period, (0, 0, 0, 0))
+        return {'books_finished': books, 'pages': pages, 'minutes': minutes, 'readers': readers}
+
+    return {'month': totals(month), 'all_time': totals(ALL_TIME)}
+
+
+def leaderboard(month, limit=10):
+    """Community totals and most-read authors/genres for a month and all time."""
+    return {
+        'month': month,
+        'totals': _totals(month),
+        'authors': {'month': _top('author', month, limit), 'all_time': _top('author', ALL_TIME, limit)},
+        'genres': {'month': _top('genre', month, limit), 'all_time': _top('genre', ALL_TIME, limit)}
+    }
@@ -0,0 +1,123 @@
+"""Response compression and compact JSON encodings.
+
+`init_app` installs an `after_request` hook that gzip/brotli-compresses
+responses whose mimetype is in `COMPRESS_MIMETYPES` and whose body is at
+least `COMPRESS_MIN_SIZE` bytes. Streamed responses (e.g. `/api/export`)
+are compressed chunk by chunk, so they keep streaming.
+"""
+import zlib
+from flask import current_app, jsonify, request
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip is offered without it
+    brotli = None
+
+# List endpoints return {"columns": [...], "rows": [[...], ...]} for this type
+COLUMNAR_MIMETYPE = 'application/vnd.biblioteca.columnar+json'
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def _choose_encoding():
+    """The best encoding the client accepts, or None."""
+    accepted = request.accept_encodings
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compressor(encoding, config):
+    if encoding == 'br':
+        return _Brotli(config['COMPRESS_BR_QUALITY'])
+    return _Gzip(config['COMPRESS_LEVEL'])
+
+
+def _compress_stream(chunks, compressor):
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_response(response):
+    """Compress `response` in place when it qualifies (after_request hook)."""
+    config = current_app.config
+    if (request.method == 'HEAD'
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or 'no-transform' in response.headers.get('Cache-Control', '')
+            or response.mimetype not in config['COMPRESS_MIMETYPES']):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, _compressor(encoding, config))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        compressor = _compressor(encoding, config)
+        response.set_data(compressor.compress(data) + compressor.finish())
+        if response.headers.get('ETag'):
+            # A different body needs a different validator
+            tag, weak = response.get_etag()
+            response.set_etag(f'{tag}-{encoding}', weak)
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def jsonify_rows(rows):
+    """jsonify a list of dicts, or as columns + rows when the client asks.
+
+    Clients opt into the columnar form with
+    `Accept: application/vnd.biblioteca.columnar+json`; keys are then sent
+    once instead of on every row.
+    """
+    best = request.accept_mimetypes.best_match(['application/json', COLUMNAR_MIMETYPE])
+    if best != COLUMNAR_MIMETYPE:
+        response = jsonify(rows)
+    else:
+        columns = list(rows[0]) if rows else []
+        response = jsonify({
+            'columns': columns,
+            'rows': [[row[column] for column in columns] for row in rows]
+        })
+        response.mimetype = COLUMNAR_MIMETYPE
+    response.vary.add('Accept')
+    return response
+
+
+def init_app(app):
+    """Enable response compression for `app`."""
+    app.after_request(compress_response)
@@ -16,6 +16,35 @@ class Config:
     SQLALCHEMY_DATABASE_URI = database_url
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Optional read replicas (comma-separated URLs), used by GET requests
+    # (see replicas.py). Clients read from the primary for a while after
+    # writing, so they always see their own changes.
+    replica_urls = [
+        url.strip().replace('postgres://', 'postgresql://', 1)
+        for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()
+    ]
+    SQLALCHEMY_BINDS = {f'replica{i}': url for i, url in enumerate(replica_urls)}
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+    
+    # Concurrency: each worker thread/greenlet may hold one pooled connection
+    # (see gunicorn.conf.py). DB_MAX_CONNECTIONS is what the database allows
+    # for this service across all workers.
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', 4))
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or WEB_THREADS)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+    DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 20))
+    # Connections each worker opens before it reports ready (see health.py)
+    WARMUP_CONNECTIONS = int(os.environ.get('WARMUP_CONNECTIONS') or DB_POOL_SIZE)
+    DB_POOL_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': 10,
+        'pool_recycle': 300  # drop connections before the pooler does
+    }
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+    if not database_url.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS.update(DB_POOL_OPTIONS)
+    
     # Session / Login configuration
     REMEMBER_COOKIE_DURATION = timedelta(days=30)  # Stay logged in for 30 days
     PERMANENT_SESSION_LIFETIME = timedelta(days=30)
@@ -25,4 +54,58 @@ class Config:
     
     # Upload settings
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
+    # Point it at a persistent disk in production: covers are stored here
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads'
+    )
+    
+    # Cover cache (see covers.py)
+    COVER_WORKERS = int(os.environ.get('COVER_WORKERS', 2))
+    COVER_MAX_BYTES = 5 * 1024 * 1024
+    COVER_FETCH_TIMEOUT = 10  # seconds
+    # Allow fetching covers from private/loopback hosts (local testing only)
+    COVER_ALLOW_PRIVATE_HOSTS = os.environ.get('COVER_ALLOW_PRIVATE_HOSTS') == '1'
+    
+    # In-memory quote cache per worker
+    QUOTE_CACHE_SECONDS = 300
+    
+    # Background jobs (see jobs.py). Set JOB_WORKERS=0 when a separate
+    # `flask --app app run-jobs` process runs them.
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+    JOB_POLL_INTERVAL = 5  # seconds
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETRY_DELAY = 10  # seconds, doubled on every retry
+    JOB_TIMEOUT = 600  # seconds before a running job is considered abandoned
+    JOB_RETENTION_DAYS = 7
+    
+    # Community leaderboards (see community.py): how often the job workers
+    # fold recent changes into the summary table
+    COMMUNITY_COMPACT_INTERVAL = int(os.environ.get('COMMUNITY_COMPACT_INTERVAL', 30))  # seconds
+    
+    # Send X-DB-Queries / X-DB-Time headers (see querylog.py, tools/loadtest.py)
+    QUERY_STATS_HEADERS = os.environ.get('QUERY_STATS_HEADERS') == '1'
+    
+    # Sampling profiler (see profiling.py). With PROFILE_ENABLED=1, requests
+    # to PROFILE_ROUTES sending `X-Profile: <PROFILE_TOKEN>`, plus a random
+    # PROFILE_FRACTION of them, are profiled into PROFILE_DIR.
+    PROFILE_ENABLED = os.environ.get('PROFILE_ENABLED') == '1'
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_ROUTES = [
+        prefix.strip()
+        for prefix in os.environ.get('PROFILE_ROUTES', '/api/stats/,/api/export').split(',') if prefix.strip()
+    ]
+    PROFILE_FRACTION = float(os.environ.get('PROFILE_FRACTION', 0))
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    PROFILE_MAX_PER_MINUTE = int(os.environ.get('PROFILE_MAX_PER_MINUTE', 6))
+    PROFILE_FORMAT = os.environ.get('PROFILE_FORMAT', 'speedscope')  # or 'collapsed'
+    PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+    
+    # Response compression (see compression.py)
+    COMPRESS_MIN_SIZE = 1024  # bytes
+    COMPRESS_LEVEL = 6  # gzip, 1-9
+    COMPRESS_BR_QUALITY = 4  # brotli, 0-11
+    COMPRESS_MIMETYPES = {
+        'application/json', 'application/vnd.biblioteca.columnar+json',
+        'application/javascript', 'text/javascript', 'text/html', 'text/css',
+        'text/plain', 'image/svg+xml'
+    }
@@ -0,0 +1,373 @@
+"""Local cover-image cache.
+
+Remote `Book.cover_url` images are downloaded once by a `cache-cover`
+background job (or uploaded directly), stored content-addressed under
+`UPLOAD_FOLDER/covers` and turned into WebP thumbnails by a small thread
+pool. Covers are then served from `/covers/<key>` and `/covers/<key>/<size>`
+with long-lived cache headers.
+"""
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import re
+import socket
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+from flask import abort, current_app, redirect, send_from_directory
+from sqlalchemy import select, update
+from models import db, Book
+import jobs
+
+try:
+    from PIL import Image
+except ImportError:  # optional: originals are served without thumbnails
+    Image = None
+
+# Thumbnail name -> maximum width in pixels
+THUMB_SIZES = {'small': 160, 'medium': 320, 'large': 640}
+# Leading bytes of the accepted image formats -> stored extension
+SIGNATURES = [
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+]
+# Redirects followed when fetching a remote cover
+MAX_REDIRECTS = 3
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}\.(jpg|png|gif|webp)$')
+ONE_YEAR = 365 * 24 * 60 * 60
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class CoverError(ValueError):
+    """The cover could not be fetched or is not a supported image."""
+
+
+class CoverUnavailable(CoverError):
+    """The remote host failed or did not answer; fetching again may work."""
+
+
+# ============================================
+# Storage
+# ============================================
+
+def covers_folder(app=None):
+    app = app or current_app
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'covers')
+
+
+def _extension(content):
+    for signature, ext in SIGNATURES:
+        if content.startswith(signature):
+            return ext
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return '.webp'
+    raise CoverError('Unsupported image format')
+
+
+def _check_image(content, config):
+    """The extension of a cover image, or CoverError if it is too large or corrupt."""
+    if len(content) > config['COVER_MAX_BYTES']:
+        raise CoverError('Cover image is too large')
+    ext = _extension(content)
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                image.verify()
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            raise CoverError(f'Cannot decode image: {e}')
+    return ext
+
+
+def store_cover(content, app=None):
+    """Check an original image, store it under its content hash and return its key."""
+    key = hashlib.sha256(content).hexdigest() + _check_image(content, (app or current_app).config)
+    folder = covers_folder(app)
+    path = os.path.join(folder, key)
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    return key
+
+
+def _thumb_name(key, size):
+    return f'{key.rsplit(".", 1)[0]}_{size}.webp'
+
+
+def make_thumbnails(key, app=None):
+    """Write the WebP thumbnails of a stored cover (skipping existing ones)."""
+    if Image is None:
+        return
+    folder = covers_folder(app)
+    try:
+        with Image.open(os.path.join(folder, key)) as source:
+            image = source.convert('RGBA' if source.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # UnidentifiedImageError is an OSError: a valid signature, bad data
+        raise CoverError(f'Cannot decode image: {e}')
+    for size, width in THUMB_SIZES.items():
+        path = os.path.join(folder, _thumb_name(key, size))
+        if os.path.exists(path):
+            continue
+        thumb = image.copy()
+        thumb.thumbnail((width, width * 2))
+        thumb.save(f'{path}.tmp', 'WEBP', quality=80, method=6)
+        os.replace(f'{path}.tmp', path)
+
+
+# ============================================
+# Remote fetching
+# ============================================
+
+def _resolve_host(hostname, port, allow_private):
+    """An address of `hostname` to connect to, refusing private ones (unless allowed)."""
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(hostname, port, type=socket.SOCK_STREAM)]
+    except socket.gaierror:
+        raise CoverUnavailable(f'Cannot resolve {hostname}')
+    if not allow_private:
+        for address in addresses:
+            if not ipaddress.ip_address(address.split('%')[0]).is_global:
+                raise CoverError(f'Refusing to fetch from {hostname}')
+    return addresses[0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to an already checked address (no second DNS lookup)."""
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection to an already checked address, verified for `host`."""
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, context=ssl.create_default_context(), **kwargs)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def fetch_cover(url, app=None):
+    """Download a remote image, enforcing the configured size and timeout.
+
+    Every hop (the URL and each redirect) is resolved once, checked, and
+    connected to at that address, so neither a redirect nor a second DNS
+    answer can point the request at an internal host.
+    """
+    config = (app or current_app).config
+    limit = config['COVER_MAX_BYTES']
+    for _ in range(MAX_REDIRECTS + 1):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            raise CoverError('Cover URL must be http(s)')
+        https = parsed.scheme == 'https'
+        port = parsed.port or (443 if https else 80)
+        address = _resolve_host(parsed.hostname, port, config['COVER_ALLOW_PRIVATE_HOSTS'])
+
+        connection_class = _PinnedHTTPSConnection if https else _PinnedHTTPConnection
+        connection = connection_class(
+            parsed.hostname, address, port=port, timeout=config['COVER_FETCH_TIMEOUT']
+        )
+        path = (parsed.path or '/') + (f'?{parsed.query}' if parsed.query else '')
+        try:
+            connection.request('GET', path, headers={'User-Agent': 'BibliotecaPessoal/1.0'})
+            response = connection.getresponse()
+            if response.status in (301, 302, 303, 307, 308):
+                location = response.getheader('Location')
+                if not location:
+                    raise CoverError('Redirect without a location')
+                url = urljoin(url, location)
+                continue
+            if response.status >= 500 or response.status == 429:
+                raise CoverUnavailable(f'Cannot fetch cover: HTTP {response.status}')
+            if response.status != 200:
+                raise CoverError(f'Cannot fetch cover: HTTP {response.status}')
+            content = response.read(limit + 1)
+        except (OSError, http.client.HTTPException) as e:
+            raise CoverUnavailable(f'Cannot fetch cover: {e}')
+        finally:
+            connection.close()
+        if len(content) > limit:
+            raise CoverError('Cover image is too large')
+        return content
+    raise CoverError('Too many redirects')
+
+
+def is_remote(url):
+    return bool(url) and urlparse(url).scheme in ('http', 'https')
+
+
+def local_key(url):
+    """The cover key of a `/covers/<key>` URL, or None for any other URL."""
+    match = re.match(r'^/covers/([^/]+)$', url or '')
+    return match.group(1) if match and KEY_PATTERN.match(match.group(1)) else None
+
+
+# ============================================
+# Background processing
+# ============================================
+
+def _pool(app):
+    global _executor
+    # Created on first use so that every (forked) worker gets its own threads
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app.config['COVER_WORKERS'],
+                thread_name_prefix='covers'
+            )
+    return _executor
+
+
+def store_remote_cover(book_id, url):
+    """Fetch and store a book's remote cover, record its key and queue its thumbnails."""
+    key = store_cover(fetch_cover(url))
+    schedule_thumbnails(key)
+    # Only if the book still points at the URL we fetched
+    db.session.execute(
+        update(Book).where(
+            Book.id == book_id,
+            Book.cover_url == url
+        ).values(cover_key=key).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return key
+
+
+@jobs.task('cache-cover')
+def cache_cover_job(book_id, url):
+    """Job: cache a book's remote cover; only unreachable hosts are retried."""
+    try:
+        return {'key': store_remote_cover(book_id, url)}
+    except CoverUnavailable:
+        raise
+    except CoverError as e:
+        # Too large, not an image, private host...: retrying will not help
+        return {'key': None, 'error': str(e)}
+
+
+def cache_remote_cover(app, book_id, url):
+    """`store_remote_cover`, logging failures instead of raising them."""
+    with app.app_context():
+        try:
+            return store_remote_cover(book_id, url)
+        except CoverError as e:
+            app.logger.warning('Cover for book %s not cached: %s', book_id, e)
+            return None
+
+
+def schedule_remote_cover(book_id, url):
+    """Cache a book's remote cover in the background (retried if unreachable)."""
+    if is_remote(url):
+        url_hash = hashlib.sha256(url.encode()).hexdigest()[:16]
+        return jobs.enqueue(
+            'cache-cover', {'book_id': book_id, 'url': url},
+            dedup_key=f'cover:{book_id}:{url_hash}'
+        )
+
+
+def schedule_thumbnails(key):
+    """Generate the thumbnails of a stored cover in the background."""
+    app = current_app._get_current_object()
+    return _pool(app).submit(_thumbnails_job, app, key)
+
+
+def _thumbnails_job(app, key):
+    with app.app_context():
+        try:
+            make_thumbnails(key, app)
+        except CoverError as e:
+            app.logger.warning('No thumbnails for cover %s: %s', key, e)
+
+
+def cache_missing_covers(app):
+    """Cache every remote cover that has no local copy yet (synchronously)."""
+    books = db.session.execute(
+        select(Book.id, Book.cover_url).where(
+            Book.cover_key.is_(None),
+            Book.cover_url.isnot(None)
+        )
+    ).all()
+    return sum(
+        1 for book_id, url in books
+        if is_remote(url) and cache_remote_cover(app, book_id, url)
+    )
+
+
+def forget_missing_covers(app):
+    """Clear the keys whose file is gone and queue their remote covers again.
+
+    UPLOAD_FOLDER may live on an ephemeral disk (Render's is reset on every
+    deploy) while the keys stay in the database. Uploaded covers, whose only
+    copy was that file, lose their URL too.
+    """
+    folder = covers_folder(app)
+    books = db.session.execute(
+        select(Book.id, Book.cover_url, Book.cover_key).where(Book.cover_key.isnot(None))
+    ).all()
+    missing = [
+        (book_id, url, key) for book_id, url, key in books
+        if not os.path.exists(os.path.join(folder, key))
+    ]
+    for book_id, url, key in missing:
+        values = {'cover_key': None}
+        if local_key(url) == key:
+            values['cover_url'] = None
+        db.session.execute(
+            update(Book).where(Book.id == book_id, Book.cover_key == key)
+            .values(**values).execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    for book_id, url, key in missing:
+        schedule_remote_cover(book_id, url)
+    return len(missing)
+
+
+# ============================================
+# Flask integration
+# ============================================
+
+def init_app(app):
+    """Register the cover routes and CLI command."""
+
+    @app.route('/covers/<key>')
+    @app.route('/covers/<key>/<size>')
+    def cover_image(key, size=None):
+        """Serve a cached cover or one of its thumbnails."""
+        if not KEY_PATTERN.match(key) or (size and size not in THUMB_SIZES):
+            abort(404)
+        folder = covers_folder()
+        if not os.path.exists(os.path.join(folder, key)):
+            # Lost with the disk (see forget_missing_covers): use the remote original meanwhile
+            urls = db.session.scalars(select(Book.cover_url).where(Book.cover_key == key))
+            url = next((url for url in urls if is_remote(url)), None)
+            if url is None:
+                abort(404)
+            return redirect(url)
+        if size and os.path.exists(os.path.join(folder, _thumb_name(key, size))):
+            return send_from_directory(folder, _thumb_name(key, size), max_age=ONE_YEAR)
+        # Thumbnail still being generated: serve the original, briefly cached
+        return send_from_directory(folder, key, max_age=None if size else ONE_YEAR)
+
+    @app.cli.command('cache-covers')
+    def cache_covers_command():
+        """Download and thumbnail every remote cover not cached yet."""
+        count = cache_missing_covers(app)
+        print(f'{count} capa(s) armazenadas localmente.')
@@ -22,6 +22,7 @@ CREATE TABLE IF NOT EXISTS books (
     genre VARCHAR(50),
     pages INTEGER,
     cover_url VARCHAR(500),
+    cover_key VARCHAR(80),
     status VARCHAR(20) DEFAULT 'want_to_read',
     queue_order INTEGER DEFAULT 0,
     priority VARCHAR(20) DEFAULT 'normal',
@@ -32,6 +33,8 @@ CREATE TABLE IF NOT EXISTS books (
     start_date DATE,
     end_date DATE,
     current_page INTEGER DEFAULT 0,
+    pages_read_total INTEGER NOT NULL DEFAULT 0,
+    last_read_date DATE,
     rating INTEGER,
     observations TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -63,6 +66,79 @@ CREATE TABLE IF NOT EXISTS notes (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Tabela de Totais Diários (derivada do diário, usada nas análises)
+CREATE TABLE IF NOT EXISTS daily_reading_rollups (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    pages INTEGER NOT NULL DEFAULT 0,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    books_touched INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, date)
+);
+
+-- Tabela de Características dos Livros (usada nas sugestões da fila)
+CREATE TABLE IF NOT EXISTS book_features (
+    book_id INTEGER PRIMARY KEY REFERENCES books(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(20),
+    rating INTEGER,
+    features TEXT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Tabela de Tarefas em Segundo Plano (exportações, recálculos, capas)
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    kind VARCHAR(50) NOT NULL,
+    payload TEXT,
+    dedup_key VARCHAR(200),
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_at TIMESTAMP,
+    result TEXT,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Tabelas de Estatísticas da Comunidade (totais de todos os usuários)
+CREATE TABLE IF NOT EXISTS community_book_facts (
+    book_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    author VARCHAR(100),
+    genre VARCHAR(50),
+    pages INTEGER NOT NULL DEFAULT 0,
+    finished_month VARCHAR(7) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS community_deltas (
+    id SERIAL PRIMARY KEY,
+    period VARCHAR(7) NOT NULL,
+    kind VARCHAR(10) NOT NULL,
+    key VARCHAR(100) NOT NULL,
+    label VARCHAR(100) NOT NULL,
+    books INTEGER NOT NULL DEFAULT 0,
+    pages INTEGER NOT NULL DEFAULT 0,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    readers INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS community_stats (
+    period VARCHAR(7) NOT NULL,
+    kind VARCHAR(10) NOT NULL,
+    key VARCHAR(100) NOT NULL,
+    label VARCHAR(100) NOT NULL,
+    books INTEGER NOT NULL DEFAULT 0,
+    pages INTEGER NOT NULL DEFAULT 0,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    readers INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (period, kind, key)
+);
+
 -- Tabela de Citações Diárias
 CREATE TABLE IF NOT EXISTS daily_quotes (
     id SERIAL PRIMARY KEY,
@@ -79,8 +155,28 @@ CREATE INDEX IF NOT EXISTS idx_books_user_id ON books(user_id);
 CREATE INDEX IF NOT EXISTS idx_books_status ON books(status);
 CREATE INDEX IF NOT EXISTS idx_reading_diary_user_id ON reading_diary(user_id);
 CREATE INDEX IF NOT EXISTS idx_reading_diary_date ON reading_diary(date);
+CREATE INDEX IF NOT EXISTS idx_reading_diary_book_id ON reading_diary(book_id);
+CREATE INDEX IF NOT EXISTS idx_reading_diary_user_date ON reading_diary(user_id, date);
 CREATE INDEX IF NOT EXISTS idx_notes_user_id ON notes(user_id);
 CREATE INDEX IF NOT EXISTS idx_notes_book_id ON notes(book_id);
+CREATE INDEX IF NOT EXISTS idx_book_features_user_id ON book_features(user_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs(status, run_after);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_jobs_active_dedup_key ON jobs(dedup_key)
+    WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS idx_community_book_facts_user_id ON community_book_facts(user_id);
+CREATE INDEX IF NOT EXISTS idx_community_stats_ranking ON community_stats(kind, period, books);
+
+-- =============================================
+-- Atualizações para bancos já existentes
+-- (aplicadas também por: flask --app app init-db)
+-- =============================================
+
+-- Progresso de leitura mantido pelo diário (depois rode: flask --app app repair-progress)
+ALTER TABLE books ADD COLUMN IF NOT EXISTS pages_read_total INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE books ADD COLUMN IF NOT EXISTS last_read_date DATE;
+
+-- Cópia local das capas (depois rode: flask --app app cache-covers)
+ALTER TABLE books ADD COLUMN IF NOT EXISTS cover_key VARCHAR(80);
 
 -- =============================================
 -- Inserir citações literárias
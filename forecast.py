@@ -0,0 +1,121 @@
+"""Reading-pace forecasts for the current books and the reading queue.
+
+The pace is an exponentially weighted moving average (EWMA) of pages read
+per calendar day over the recent diary. A genre's pace scales it by how many
+pages the user reads on a day spent on that genre, relative to any reading
+day, so switching genres does not make the previous one look abandoned.
+Books are then projected one after another: the ones being read first,
+followed by the `want_to_read` queue in order.
+"""
+import math
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import select
+from models import db, Book, ReadingDiary
+
+# How far back the diary is read and how quickly old days stop mattering
+PACE_WINDOW_DAYS = 90
+PACE_SPAN_DAYS = 14
+# A genre needs this many reading days before its own pace is trusted
+MIN_GENRE_DAYS = 5
+# Bounds of a genre's pace relative to the overall pace
+GENRE_PACE_BOUNDS = (0.25, 4.0)
+
+
+def _ewma(daily_pages, start, days, span=PACE_SPAN_DAYS):
+    """EWMA of a {date: pages} mapping over `days` consecutive days."""
+    alpha = 2 / (span + 1)
+    average = None
+    for offset in range(days):
+        pages = daily_pages.get(start + timedelta(days=offset), 0)
+        average = pages if average is None else alpha * pages + (1 - alpha) * average
+    return average or 0
+
+
+def reading_pace(user_id, today=None):
+    """Pages-per-day pace overall and per genre, from one diary query."""
+    today = today or date.today()
+    start = today - timedelta(days=PACE_WINDOW_DAYS - 1)
+    rows = db.session.execute(
+        select(ReadingDiary.date, ReadingDiary.pages_read, Book.genre).outerjoin(
+            Book, ReadingDiary.book_id == Book.id
+        ).where(
+            ReadingDiary.user_id == user_id,
+            ReadingDiary.date >= start,
+            ReadingDiary.date <= today
+        )
+    ).all()
+
+    overall = defaultdict(int)
+    by_genre = defaultdict(lambda: defaultdict(int))
+    for day, pages, genre in rows:
+        overall[day] += pages or 0
+        if genre and pages:
+            by_genre[genre][day] += pages
+
+    pace = _ewma(overall, start, PACE_WINDOW_DAYS)
+    reading_days = [pages for pages in overall.values() if pages > 0]
+    per_reading_day = sum(reading_days) / len(reading_days) if reading_days else 0
+
+    genres = {}
+    low, high = GENRE_PACE_BOUNDS
+    for genre, days in by_genre.items():
+        if len(days) < MIN_GENRE_DAYS or not per_reading_day:
+            continue
+        # Pages per day spent on the genre, relative to any reading day
+        ratio = sum(days.values()) / len(days) / per_reading_day
+        genres[genre] = round(pace * min(max(ratio, low), high), 2)
+
+    return {'pages_per_day': round(pace, 2), 'genres': genres}
+
+
+def forecast_books(user_id, today=None):
+    """Project finish dates for the books being read and the whole queue.
+
+    Returns the pace plus a {book_id: estimate} mapping. Books without a page
+    count are assumed to be as long as the user's average finished book.
+    """
+    today = today or date.today()
+    pace = reading_pace(user_id, today)
+
+    books = db.session.execute(
+        select(Book.id, Book.status, Book.genre, Book.pages, Book.current_page).where(
+            Book.user_id == user_id,
+            Book.status.in_(['reading', 'want_to_read'])
+        ).order_by(
+            # Books being read come first, then the queue in its order
+            (Book.status == 'want_to_read'), Book.start_date, Book.queue_order, Book.id
+        )
+    ).all()
+    average_pages = db.session.execute(
+        select(db.func.avg(Book.pages)).where(
+            Book.user_id == user_id,
+            Book.status == 'read',
+            Book.pages.isnot(None)
+        )
+    ).scalar()
+
+    estimates = {}
+    elapsed = 0.0
+    for book_id, status, genre, pages, current_page in books:
+        rate = pace['genres'].get(genre) or pace['pages_per_day']
+        estimated_pages = pages is None
+        total = pages if pages is not None else average_pages
+        if elapsed is None or not rate or not total:
+            # Everything after a book we cannot estimate is unknown as well
+            elapsed = None
+            estimates[book_id] = {'days_left': None, 'finish_date': None, 'estimated_pages': estimated_pages}
+            continue
+
+        remaining = max(total - (current_page or 0), 0)
+        elapsed += remaining / rate
+        days_left = math.ceil(elapsed)
+        estimates[book_id] = {
+            'pages_left': round(remaining),
+            'pages_per_day': rate,
+            'days_left': days_left,
+            'finish_date': (today + timedelta(days=days_left)).isoformat(),
+            'estimated_pages': estimated_pages
+        }
+
+    return pace, estimates
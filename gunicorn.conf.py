@@ -0,0 +1,64 @@
+"""Gunicorn settings (used via `gunicorn -c gunicorn.conf.py app:app`).
+
+Concurrency profile, tunable through environment variables:
+
+- GUNICORN_WORKER_CLASS: `gthread` (default) or `gevent`
+- WEB_THREADS: threads per gthread worker; also the per-worker DB pool size
+- WEB_CONCURRENCY: number of workers (derived from CPU and DB_MAX_CONNECTIONS
+  when unset)
+- GUNICORN_WORKER_CONNECTIONS: concurrent greenlets per gevent worker
+"""
+import multiprocessing
+import os
+
+from config import Config
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = Config.WEB_THREADS
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+
+# Most request time is spent waiting on the database, so the limit is how many
+# connections the database accepts, not the CPU: each worker may hold up to
+# pool_size + max_overflow of them.
+_connections_per_worker = Config.DB_POOL_SIZE + Config.DB_MAX_OVERFLOW
+workers = int(os.environ.get('WEB_CONCURRENCY') or max(1, min(
+    multiprocessing.cpu_count() * 2 + 1,
+    Config.DB_MAX_CONNECTIONS // _connections_per_worker
+)))
+
+# Import the app once in the master and fork the workers from it. Importing
+# app.py performs no I/O, so nothing but code is shared with the workers.
+# gevent must patch the standard library before the app is imported, so it
+# loads the app in each worker instead.
+preload_app = worker_class != 'gevent'
+
+
+def post_fork(server, worker):
+    """Give each worker its own connection pool, created lazily on first use."""
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+        except ImportError:
+            server.log.warning('psycogreen is not installed: psycopg2 calls will block the gevent worker')
+        else:
+            patch_psycopg()
+        return
+
+    from app import app
+    from models import db
+
+    with app.app_context():
+        for engine in db.engines.values():  # primary and any read replicas
+            engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    """Warm the worker up before it accepts connections (see health.py)."""
+    from app import app
+    import health
+
+    try:
+        health.warm_up(app)
+    except Exception as e:
+        # Still serve: /readyz reports 503 and retries the warm-up
+        worker.log.warning('Warm-up failed: %s', e)
@@ -0,0 +1,109 @@
+"""Liveness/readiness endpoints and worker warm-up.
+
+`/healthz` only says the process is serving requests. `/readyz` says the
+worker is warm and its databases answer: it returns 503 until `warm_up()`
+has pre-opened the connection pools and run the registered warm-up steps
+(priming in-memory caches and compiling the hot statements), and whenever a
+database check fails.
+
+gunicorn runs `warm_up()` in `post_worker_init`, before the worker accepts
+connections, so a new or restarted worker never serves a cold request.
+Other servers warm up on the first `/readyz` call.
+"""
+import threading
+import time
+from flask import jsonify
+from sqlalchemy import text
+from models import db
+
+_steps = []
+_state = {'ready': False, 'warm_up_ms': None}
+_warm_up_lock = threading.Lock()
+
+
+def warm_up_step(func):
+    """Register `func` to run (inside an app context) during warm-up."""
+    _steps.append(func)
+    return func
+
+
+def _prefill_pool(engine, count):
+    """Open up to `count` pooled connections so the first requests reuse them."""
+    size = getattr(engine.pool, 'size', None)
+    count = min(count, size()) if size else 1
+    connections = []
+    try:
+        for _ in range(count):
+            connection = engine.connect()
+            connection.execute(text('SELECT 1'))
+            connections.append(connection)
+    finally:
+        # Returned connections stay open in the pool
+        for connection in connections:
+            connection.close()
+    return count
+
+
+def warm_up(app):
+    """Fill the connection pools and run the warm-up steps (once per process)."""
+    with _warm_up_lock:
+        if _state['ready']:
+            return
+        started = time.perf_counter()
+        with app.app_context():
+            for engine in db.engines.values():
+                _prefill_pool(engine, app.config['WARMUP_CONNECTIONS'])
+            for step in _steps:
+                step()
+        _state['warm_up_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        _state['ready'] = True
+        app.logger.info('Worker warmed up in %s ms', _state['warm_up_ms'])
+
+
+def _check_engine(engine):
+    """Round-trip to the database and describe the pool."""
+    started = time.perf_counter()
+    try:
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+    except Exception as e:
+        return {'ok': False, 'error': str(e).splitlines()[0]}
+    check = {'ok': True, 'latency_ms': round((time.perf_counter() - started) * 1000, 1)}
+    pool = engine.pool
+    if hasattr(pool, 'checkedout'):
+        check['pool'] = {
+            'size': pool.size(),
+            'idle': pool.checkedin(),
+            'in_use': pool.checkedout(),
+            'overflow': pool.overflow()
+        }
+    return check
+
+
+def init_app(app):
+    """Register the health endpoints."""
+
+    @app.route('/healthz')
+    def healthz():
+        """Liveness: the process answers requests."""
+        return jsonify({'status': 'ok'})
+
+    @app.route('/readyz')
+    def readyz():
+        """Readiness: warmed up and every database reachable."""
+        try:
+            warm_up(app)
+        except Exception as e:
+            app.logger.warning('Warm-up failed: %s', e)
+        databases = {
+            key or 'primary': _check_engine(engine) for key, engine in db.engines.items()
+        }
+        ready = _state['ready'] and all(check['ok'] for check in databases.values())
+        response = jsonify({
+            'status': 'ready' if ready else 'unavailable',
+            'warm_up_ms': _state['warm_up_ms'],
+            'databases': databases
+        })
+        response.status_code = 200 if ready else 503
+        response.headers['Cache-Control'] = 'no-store'
+        return response
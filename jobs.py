@@ -0,0 +1,276 @@
+"""Database-backed background jobs.
+
+Jobs are rows in the `jobs` table, so no broker is needed: `enqueue()`
+inserts one and any worker claims it with a conditional UPDATE. Each web
+process runs `JOB_WORKERS` worker threads (started on its first request);
+`flask --app app run-jobs` runs a standalone worker instead.
+
+Handlers are registered with `@task('<kind>')`, receive the job's payload as
+keyword arguments and return a JSON-serializable result. A handler that
+raises is retried with exponential backoff until `max_attempts`. While a
+handler runs, a heartbeat renews the job's `locked_at`; a job whose worker
+died stops being renewed and is picked up again after `JOB_TIMEOUT`. While a job with a given
+`dedup_key` is queued or running, enqueueing the same key returns it.
+
+Functions registered with `@periodic('<SETTING>')` run from every worker
+loop each `app.config[SETTING]` seconds, so they must tolerate running in
+several threads and processes at once.
+"""
+import json
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from models import db, Job
+
+ACTIVE = ('queued', 'running')
+
+_tasks = {}
+_periodic = []
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+class UnknownTask(LookupError):
+    """No handler is registered for a job's kind."""
+
+
+def task(kind):
+    """Register the decorated function as the handler for `kind` jobs."""
+    def decorator(func):
+        _tasks[kind] = func
+        return func
+    return decorator
+
+
+def periodic(setting):
+    """Run the decorated function every `app.config[setting]` seconds."""
+    def decorator(func):
+        _periodic.append((func, setting))
+        return func
+    return decorator
+
+
+# ============================================
+# Enqueueing
+# ============================================
+
+def _active_job(dedup_key):
+    return db.session.scalar(
+        select(Job).where(Job.dedup_key == dedup_key, Job.status.in_(ACTIVE))
+    )
+
+
+def enqueue(kind, payload=None, user_id=None, dedup_key=None, max_attempts=None, delay=0):
+    """Queue a job (committing the session) and return it.
+
+    If a job with `dedup_key` is already queued or running, that job is
+    returned instead.
+    """
+    if kind not in _tasks:
+        raise UnknownTask(kind)
+    if dedup_key is not None:
+        existing = _active_job(dedup_key)
+        if existing is not None:
+            return existing
+
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        user_id=user_id,
+        dedup_key=dedup_key,
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_after=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request enqueued the same key in the meantime
+        db.session.rollback()
+        return _active_job(dedup_key)
+    _wakeup.set()
+    return job
+
+
+# ============================================
+# Running
+# ============================================
+
+def _claimable(now, timeout):
+    """Queued jobs that are due, and running jobs whose worker went away."""
+    return or_(
+        and_(Job.status == 'queued', Job.run_after <= now),
+        and_(Job.status == 'running', Job.locked_at < now - timedelta(seconds=timeout))
+    )
+
+
+def claim_next():
+    """Mark the next due job as running and return it (None if there is none)."""
+    now = datetime.utcnow()
+    claimable = _claimable(now, current_app.config['JOB_TIMEOUT'])
+    candidates = db.session.scalars(
+        select(Job.id).where(claimable).order_by(Job.run_after, Job.id).limit(5)
+    ).all()
+    for job_id in candidates:
+        # Only one worker's UPDATE can still match the claim condition
+        claimed = db.session.execute(
+            update(Job).where(Job.id == job_id, claimable).values(
+                status='running', locked_at=now, attempts=Job.attempts + 1
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+    return None
+
+
+def _heartbeat(app, job_id, stop):
+    """Renew a running job's lock until `stop` is set."""
+    while not stop.wait(app.config['JOB_TIMEOUT'] / 3):
+        try:
+            with app.app_context():
+                db.session.execute(
+                    update(Job).where(Job.id == job_id, Job.status == 'running')
+                    .values(locked_at=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+        except Exception as e:
+            app.logger.warning('Job %s heartbeat failed: %s', job_id, e)
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome."""
+    try:
+        if job.attempts > job.max_attempts:
+            raise RuntimeError('Job timed out')
+        handler = _tasks.get(job.kind)
+        if handler is None:
+            raise UnknownTask(job.kind)
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(current_app._get_current_object(), job.id, stop),
+            name=f'job-{job.id}-heartbeat', daemon=True
+        )
+        heartbeat.start()
+        try:
+            result = handler(**json.loads(job.payload or '{}'))
+        finally:
+            stop.set()
+            heartbeat.join()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning('Job %s (%s) failed: %s', job.id, job.kind, e)
+        job.error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        if job.attempts < job.max_attempts and not isinstance(e, UnknownTask):
+            job.status = 'queued'
+            delay = current_app.config['JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1)
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+    else:
+        job.status = 'done'
+        job.result = json.dumps(result)
+        job.error = None
+        job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+
+def run_pending(app):
+    """Run due jobs until there are none left. Returns how many ran."""
+    count = 0
+    while True:
+        with app.app_context():
+            job = claim_next()
+            if job is None:
+                return count
+            run_job(job)
+        count += 1
+
+
+def run_periodic(app, next_runs):
+    """Run the periodic functions that are due (`next_runs` is the caller's schedule)."""
+    now = time.monotonic()
+    for func, setting in _periodic:
+        if now < next_runs.get(func, 0):
+            continue
+        next_runs[func] = now + app.config[setting]
+        try:
+            with app.app_context():
+                func()
+        except Exception:
+            app.logger.exception('Periodic task %s failed', func.__name__)
+
+
+def purge_finished(app):
+    """Delete finished jobs older than JOB_RETENTION_DAYS."""
+    with app.app_context():
+        cutoff = datetime.utcnow() - timedelta(days=app.config['JOB_RETENTION_DAYS'])
+        result = db.session.execute(
+            delete(Job).where(Job.status.in_(('done', 'failed')), Job.finished_at < cutoff)
+        )
+        db.session.commit()
+        return result.rowcount
+
+
+def work(app, stop=None):
+    """Worker loop: run due jobs, then sleep until woken or the poll interval."""
+    stop = stop or threading.Event()
+    next_purge = datetime.utcnow()
+    next_runs = {}
+    while not stop.is_set():
+        try:
+            run_pending(app)
+            run_periodic(app, next_runs)
+            if datetime.utcnow() >= next_purge:
+                purge_finished(app)
+                next_purge = datetime.utcnow() + timedelta(hours=1)
+        except Exception:
+            app.logger.exception('Job worker error')
+        _wakeup.wait(app.config['JOB_POLL_INTERVAL'])
+        _wakeup.clear()
+
+
+def start_workers(app):
+    """Start this process's worker threads (once)."""
+    # Started on first use so that every (forked) web worker gets its own
+    with _workers_lock:
+        if _workers:
+            return
+        for index in range(app.config['JOB_WORKERS']):
+            thread = threading.Thread(target=work, args=(app,), name=f'jobs-{index}', daemon=True)
+            thread.start()
+            _workers.append(thread)
+
+
+# ============================================
+# Flask integration
+# ============================================
+
+def init_app(app):
+    """Start the in-process workers and register the job commands."""
+
+    @app.before_request
+    def ensure_workers():
+        if not _workers and app.config['JOB_WORKERS']:
+            start_workers(app)
+
+    @app.cli.command('run-jobs')
+    @click.option('--once', is_flag=True, help='Run the due jobs and periodic tasks, then exit.')
+    def run_jobs_command(once):
+        """Run background jobs (standalone worker)."""
+        if once:
+            count = run_pending(app)
+            run_periodic(app, {})
+            print(f'{count} tarefa(s) executadas.')
+        else:
+            print('Processando tarefas em segundo plano (Ctrl+C para sair)...')
+            work(app)
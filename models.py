@@ -1,9 +1,216 @@
+import re
+import sqlite3
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, event, func, inspect, literal, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import AddConstraint, CreateIndex, CreateTable
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """Make SQLite enforce foreign keys so ON DELETE CASCADE works."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+# ============================================
+# Schema upgrades
+# ============================================
+
+def _outdated_sqlite_tables(connection):
+    """Model tables whose SQLite definition lacks a column or an ON DELETE action."""
+    outdated = []
+    for table in db.metadata.sorted_tables:
+        columns = {row[1] for row in connection.execute(f'PRAGMA table_info("{table.name}")')}
+        if not columns:
+            continue  # Not created yet: create_all() builds it from the model
+        # Rows are (id, seq, table, from, to, on_update, on_delete, match)
+        on_delete = {
+            (row[3], row[2]): row[6].upper()
+            for row in connection.execute(f'PRAGMA foreign_key_list("{table.name}")')
+        }
+        expected = {
+            (fk.parent.name, fk.column.table.name): (fk.ondelete or 'NO ACTION').upper()
+            for fk in table.foreign_keys
+        }
+        if set(table.columns.keys()) - columns or any(
+            on_delete.get(key) != action for key, action in expected.items()
+        ):
+            outdated.append(table)
+    return outdated
+
+
+def _rebuild_sqlite_table(connection, table, dialect):
+    """Copy a table into a fresh one created from its model."""
+    old_columns = {row[1] for row in connection.execute(f'PRAGMA table_info("{table.name}")')}
+    new_name = f'_new_{table.name}'
+    ddl = str(CreateTable(table).compile(dialect=dialect)).strip()
+    connection.execute(re.sub(rf'^CREATE TABLE "?{table.name}"?', f'CREATE TABLE "{new_name}"', ddl))
+
+    columns, values, params = [], [], []
+    for column in table.columns:
+        columns.append(f'"{column.name}"')
+        if column.name in old_columns:
+            values.append(f'"{column.name}"')
+        else:
+            # Columns added since the table was created get their scalar default
+            default = column.default
+            values.append('?')
+            params.append(default.arg if default is not None and default.is_scalar else None)
+    connection.execute(
+        f'INSERT INTO "{new_name}" ({", ".join(columns)}) '
+        f'SELECT {", ".join(values)} FROM "{table.name}"',
+        params
+    )
+    connection.execute(f'DROP TABLE "{table.name}"')
+    connection.execute(f'ALTER TABLE "{new_name}" RENAME TO "{table.name}"')
+    for index in table.indexes:
+        connection.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect)))
+
+
+def upgrade_sqlite_schema(engine):
+    """Rebuild SQLite tables created by older versions of the models.
+
+    SQLite cannot alter a foreign key or add a NOT NULL column, so each
+    outdated table is copied into a new one (SQLite's documented 12-step
+    procedure), in one transaction with foreign keys off. Returns the names
+    of the rebuilt tables.
+    """
+    if engine.dialect.name != 'sqlite':
+        return []
+    raw = engine.raw_connection()
+    connection = raw.driver_connection
+    isolation_level = connection.isolation_level
+    connection.isolation_level = None  # Explicit BEGIN/COMMIT below
+    try:
+        outdated = _outdated_sqlite_tables(connection)
+        if not outdated:
+            return []
+        connection.execute('PRAGMA foreign_keys=OFF')
+        connection.execute('BEGIN')
+        try:
+            for table in outdated:
+                _rebuild_sqlite_table(connection, table, engine.dialect)
+            violations = connection.execute('PRAGMA foreign_key_check').fetchall()
+            if violations:
+                tables = sorted({row[0] for row in violations})
+                raise RuntimeError(
+                    f"Rows reference missing parents in {', '.join(tables)}; "
+                    'remove them (PRAGMA foreign_key_check) and run init-db again'
+                )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return [table.name for table in outdated]
+    finally:
+        connection.execute('PRAGMA foreign_keys=ON')
+        connection.isolation_level = isolation_level
+        raw.close()
+
+
+def _missing_columns(inspector, table):
+    existing = {column['name'] for column in inspector.get_columns(table.name)}
+    return [column for column in table.columns if column.name not in existing]
+
+
+def _missing_indexes(inspector, table):
+    existing = {index['name'] for index in inspector.get_indexes(table.name)}
+    return [index for index in table.indexes if index.name not in existing]
+
+
+def _stale_foreign_keys(inspector, table):
+    """(constraint, reflected name) of the model's foreign keys whose ON DELETE differs in the database."""
+    reflected = {
+        (tuple(fk['constrained_columns']), fk['referred_table']): fk
+        for fk in inspector.get_foreign_keys(table.name)
+    }
+    stale = []
+    for constraint in table.foreign_key_constraints:
+        fk = reflected.get((tuple(constraint.column_keys), constraint.referred_table.name))
+        action = (fk['options'].get('ondelete') or 'NO ACTION').upper() if fk else None
+        if action != (constraint.ondelete or 'NO ACTION').upper():
+            stale.append((constraint, fk['name'] if fk else None))
+    return stale
+
+
+def _add_column_ddl(column, dialect):
+    """ALTER TABLE adding `column`, filling the existing rows with its scalar default."""
+    preparer = dialect.identifier_preparer
+    ddl = (
+        f'ALTER TABLE {preparer.format_table(column.table)} ADD COLUMN IF NOT EXISTS '
+        f'{preparer.format_column(column)} {column.type.compile(dialect=dialect)}'
+    )
+    default = column.default
+    if default is not None and default.is_scalar:
+        value = literal(default.arg, column.type).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+        ddl += f' DEFAULT {value}'
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    return ddl
+
+
+def outdated_tables(engine):
+    """Names of the existing tables `upgrade_schema()` would change."""
+    outdated = set()
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        existing = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name in existing and (
+                _missing_columns(inspector, table) or _missing_indexes(inspector, table)
+                or (engine.dialect.name != 'sqlite' and _stale_foreign_keys(inspector, table))
+            ):
+                outdated.add(table.name)
+    if engine.dialect.name == 'sqlite':
+        raw = engine.raw_connection()
+        try:
+            outdated.update(table.name for table in _outdated_sqlite_tables(raw.driver_connection))
+        finally:
+            raw.close()
+    return sorted(outdated)
+
+
+def upgrade_schema(engine):
+    """Bring the tables created by older versions of the models up to date.
+
+    `create_all()` only creates missing tables. SQLite tables are rebuilt
+    (see `upgrade_sqlite_schema()`); elsewhere missing columns are added and
+    foreign keys with another ON DELETE action re-created with ALTER TABLE.
+    Missing indexes are created on every dialect. Returns the names of the
+    changed tables.
+    """
+    changed = set(upgrade_sqlite_schema(engine))
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            if engine.dialect.name != 'sqlite':
+                for column in _missing_columns(inspector, table):
+                    connection.execute(text(_add_column_ddl(column, engine.dialect)))
+                    changed.add(table.name)
+                for constraint, name in _stale_foreign_keys(inspector, table):
+                    if name:
+                        preparer = engine.dialect.identifier_preparer
+                        connection.execute(text(
+                            f'ALTER TABLE {preparer.format_table(table)} DROP CONSTRAINT {preparer.quote(name)}'
+                        ))
+                    connection.execute(AddConstraint(constraint))
+                    changed.add(table.name)
+            for index in _missing_indexes(inspector, table):
+                connection.execute(CreateIndex(index, if_not_exists=True))
+                changed.add(table.name)
+    return sorted(changed)
 
 
 class User(UserMixin, db.Model):
@@ -16,10 +223,10 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Relationships
-    books = db.relationship('Book', backref='owner', lazy='dynamic', cascade='all, delete-orphan')
-    diary_entries = db.relationship('ReadingDiary', backref='owner', lazy='dynamic', cascade='all, delete-orphan')
-    notes = db.relationship('Note', backref='owner', lazy='dynamic', cascade='all, delete-orphan')
+    # Relationships (children are removed by the database's ON DELETE CASCADE)
+    books = db.relationship('Book', backref='owner', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
+    diary_entries = db.relationship('ReadingDiary', backref='owner', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
+    notes = db.relationship('Note', backref='owner', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
         """Hash and set the user's password."""
@@ -42,15 +249,20 @@ class User(UserMixin, db.Model):
 class Book(db.Model):
     """Model for books in the library."""
     __tablename__ = 'books'
+    __table_args__ = (
+        db.Index('idx_books_user_id', 'user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     author = db.Column(db.String(100))
     publisher = db.Column(db.String(100))
     genre = db.Column(db.String(50))
     pages = db.Column(db.Integer)
     cover_url = db.Column(db.String(500))
+    # Content-addressed local copy of the cover (see covers.py)
+    cover_key = db.Column(db.String(80))
     
     # Status: 'read', 'reading', 'want_to_read'
     status = db.Column(db.String(20), default='want_to_read')
@@ -68,6 +280,9 @@ class Book(db.Model):
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
     current_page = db.Column(db.Integer, default=0)  # Pages already read
+    # Maintained from the diary write endpoints (see apply_reading_progress)
+    pages_read_total = db.Column(db.Integer, default=0, nullable=False)
+    last_read_date = db.Column(db.Date)
     rating = db.Column(db.Integer)  # 1-5
     observations = db.Column(db.Text)
     
@@ -75,9 +290,9 @@ class Book(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Relationships
-    diary_entries = db.relationship('ReadingDiary', backref='book', lazy='dynamic', cascade='all, delete-orphan')
-    notes = db.relationship('Note', backref='book', lazy='dynamic', cascade='all, delete-orphan')
+    # Relationships (children are removed by the database's ON DELETE CASCADE)
+    diary_entries = db.relationship('ReadingDiary', backref='book', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
+    notes = db.relationship('Note', backref='book', lazy='dynamic', cascade='all, delete-orphan', passive_deletes=True)
     
     def to_dict(self):
         """Convert book to dictionary."""
@@ -89,6 +304,7 @@ class Book(db.Model):
             'genre': self.genre,
             'pages': self.pages,
             'cover_url': self.cover_url,
+            'cover_thumb': f'/covers/{self.cover_key}/medium' if self.cover_key else None,
             'status': self.status,
             'queue_order': self.queue_order,
             'priority': self.priority,
@@ -103,25 +319,22 @@ class Book(db.Model):
             'observations': self.observations,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'pages_read': self.get_pages_read()
+            'pages_read': self.pages_read_total or 0,
+            'last_read_date': self.last_read_date.isoformat() if self.last_read_date else None
         }
-    
-    def get_pages_read(self):
-        """Calculate total pages read from diary entries."""
-        from sqlalchemy import func
-        result = db.session.query(func.sum(ReadingDiary.pages_read)).filter(
-            ReadingDiary.book_id == self.id
-        ).scalar()
-        return result or 0
 
 
 class ReadingDiary(db.Model):
     """Model for daily reading entries."""
     __tablename__ = 'reading_diary'
+    __table_args__ = (
+        db.Index('idx_reading_diary_book_id', 'book_id'),
+        db.Index('idx_reading_diary_user_date', 'user_id', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), nullable=True)
     date = db.Column(db.Date, nullable=False)
     pages_read = db.Column(db.Integer, default=0)
     reading_time = db.Column(db.Integer)  # Minutes
@@ -149,10 +362,14 @@ class ReadingDiary(db.Model):
 class Note(db.Model):
     """Model for book notes and highlights."""
     __tablename__ = 'notes'
+    __table_args__ = (
+        db.Index('idx_notes_user_id', 'user_id'),
+        db.Index('idx_notes_book_id', 'book_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), nullable=False)
     # Type: 'quote', 'thought', 'reflection'
     type = db.Column(db.String(20), default='thought')
     content = db.Column(db.Text, nullable=False)
@@ -172,6 +389,192 @@ class Note(db.Model):
         }
 
 
+class DailyReadingRollup(db.Model):
+    """Per-user daily totals derived from the reading diary (see analytics.py)."""
+    __tablename__ = 'daily_reading_rollups'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    pages = db.Column(db.Integer, default=0, nullable=False)
+    minutes = db.Column(db.Integer, default=0, nullable=False)
+    books_touched = db.Column(db.Integer, default=0, nullable=False)
+
+
+class BookFeatures(db.Model):
+    """Recommendation features of a book and its notes (see recommend.py)."""
+    __tablename__ = 'book_features'
+    __table_args__ = (
+        db.Index('idx_book_features_user_id', 'user_id'),
+    )
+    
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(20))
+    rating = db.Column(db.Integer)
+    features = db.Column(db.Text, nullable=False)  # JSON {feature: count}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class CommunityBookFact(db.Model):
+    """What a finished book adds to the community totals (see community.py)."""
+    __tablename__ = 'community_book_facts'
+    __table_args__ = (
+        db.Index('idx_community_book_facts_user_id', 'user_id'),
+    )
+    
+    # No foreign keys: a deleted book's row is needed to subtract it
+    book_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    author = db.Column(db.String(100))
+    genre = db.Column(db.String(50))
+    pages = db.Column(db.Integer, default=0, nullable=False)
+    finished_month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+
+
+class CommunityDelta(db.Model):
+    """Pending change to a community_stats row, folded in by the compaction."""
+    __tablename__ = 'community_deltas'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(7), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    label = db.Column(db.String(100), nullable=False)
+    books = db.Column(db.Integer, default=0, nullable=False)
+    pages = db.Column(db.Integer, default=0, nullable=False)
+    minutes = db.Column(db.Integer, default=0, nullable=False)
+    readers = db.Column(db.Integer, default=0, nullable=False)
+
+
+class CommunityStat(db.Model):
+    """Totals across all users for a month (YYYY-MM) or 'all' (see community.py)."""
+    __tablename__ = 'community_stats'
+    __table_args__ = (
+        db.Index('idx_community_stats_ranking', 'kind', 'period', 'books'),
+    )
+    
+    period = db.Column(db.String(7), primary_key=True)
+    # Kind: 'author', 'genre' or 'total' (key '')
+    kind = db.Column(db.String(10), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    label = db.Column(db.String(100), nullable=False)
+    books = db.Column(db.Integer, default=0, nullable=False)  # books finished
+    pages = db.Column(db.Integer, default=0, nullable=False)  # total: diary pages; else pages of the finished books
+    minutes = db.Column(db.Integer, default=0, nullable=False)
+    readers = db.Column(db.Integer, default=0, nullable=False)  # total only: users who read
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class Job(db.Model):
+    """Background job, run by the workers in jobs.py."""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('idx_jobs_status_run_after', 'status', 'run_after'),
+        # At most one queued/running job per dedup key
+        db.Index(
+            'uq_jobs_active_dedup_key', 'dedup_key', unique=True,
+            sqlite_where=db.text("status IN ('queued', 'running')"),
+            postgresql_where=db.text("status IN ('queued', 'running')")
+        ),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text)  # JSON
+    dedup_key = db.Column(db.String(200))
+    # Status: 'queued', 'running', 'done', 'failed'
+    status = db.Column(db.String(20), default='queued', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_at = db.Column(db.DateTime)
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        """Convert job to dictionary (without its result)."""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+def _last_read_date_subquery():
+    """Correlated subquery for the most recent day a book was actually read."""
+    return select(func.max(ReadingDiary.date)).where(
+        ReadingDiary.book_id == Book.id,
+        ReadingDiary.did_read == True
+    ).scalar_subquery()
+
+
+def _page_within_book(page):
+    """`page` clamped to the book's page range (0..pages, when known)."""
+    return case(
+        (page < 0, 0),
+        (Book.pages.isnot(None) & (page > Book.pages), Book.pages),
+        else_=page
+    )
+
+
+def apply_reading_progress(user_id, book_id, pages_delta):
+    """Fold a diary change into the book's progress counters.
+    
+    Call after flushing the diary write, inside the same transaction.
+    `pages_delta` is added to `pages_read_total`. `current_page` becomes at
+    least that total (pages logged in the diary are pages read, not pages
+    on top of the bookmark), drops with it when entries are removed, and
+    stays within the book.
+    """
+    if not book_id:
+        return
+    pages_delta = pages_delta or 0
+    pages_read_total = func.coalesce(Book.pages_read_total, 0) + pages_delta
+    current_page = func.coalesce(Book.current_page, 0) + min(pages_delta, 0)
+    current_page = case((current_page < pages_read_total, pages_read_total), else_=current_page)
+    db.session.execute(
+        update(Book).where(
+            Book.id == book_id,
+            Book.user_id == user_id
+        ).values(
+            pages_read_total=pages_read_total,
+            current_page=_page_within_book(current_page),
+            last_read_date=_last_read_date_subquery()
+        ).execution_options(synchronize_session=False)
+    )
+
+
+def repair_reading_progress(user_id=None):
+    """Recompute every book's progress counters from the diary.
+    
+    Books with diary entries get `current_page` reset to the pages logged;
+    the others keep theirs (clamped to the book). Returns the number of
+    books updated.
+    """
+    pages_read = select(func.coalesce(func.sum(ReadingDiary.pages_read), 0)).where(
+        ReadingDiary.book_id == Book.id
+    ).scalar_subquery()
+    stmt = update(Book).values(
+        pages_read_total=pages_read,
+        current_page=_page_within_book(
+            case((pages_read > 0, pages_read), else_=func.coalesce(Book.current_page, 0))
+        ),
+        last_read_date=_last_read_date_subquery()
+    ).execution_options(synchronize_session=False)
+    if user_id is not None:
+        stmt = stmt.where(Book.user_id == user_id)
+    result = db.session.execute(stmt)
+    db.session.commit()
+    return result.rowcount
+
+
 class DailyQuote(db.Model):
     """Model for literary quotes shown on dashboard."""
     __tablename__ = 'daily_quotes'
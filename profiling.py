@@ -0,0 +1,222 @@
+"""Opt-in sampling profiler for individual requests.
+
+Off unless `PROFILE_ENABLED` is set. Then a request to one of
+`PROFILE_ROUTES` is profiled when it carries `X-Profile: <PROFILE_TOKEN>`,
+or at random for a `PROFILE_FRACTION` of them, at most
+`PROFILE_MAX_PER_MINUTE` times per minute and process.
+
+A profiled request gets a sampler thread that records the request thread's
+Python stack every `PROFILE_INTERVAL_MS` (never more often than once per
+millisecond). While a SQL statement runs, the sample ends in a synthetic
+`SQL <verb> <table>` frame, so database waits show up next to ORM hydration
+and `to_dict()` serialization. Streamed responses are profiled until the
+last chunk is sent. Each profile is written to `PROFILE_DIR` as a
+speedscope file (https://www.speedscope.app) or as collapsed stacks for
+flamegraph.pl; the response's `X-Profile-Id` header names it.
+"""
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Fastest sampling allowed, whatever PROFILE_INTERVAL_MS says
+MIN_INTERVAL_MS = 1.0
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Thread id -> label of the SQL statement it is executing (profiled threads only)
+_active_sql = {}
+_profiled_threads = set()
+_recent_starts = deque()
+_budget_lock = threading.Lock()
+
+
+# ============================================
+# SQL attribution
+# ============================================
+
+def _sql_label(statement):
+    """`SQL SELECT books`-style name of a statement."""
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'SQL'
+    match = re.search(r'\b(?:FROM|INTO|UPDATE)\s+"?(\w+)', statement, re.I)
+    return f'SQL {verb} {match.group(1)}' if match else f'SQL {verb}'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    thread_id = threading.get_ident()
+    if thread_id in _profiled_threads:
+        _active_sql[thread_id] = _sql_label(statement)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _active_sql.pop(threading.get_ident(), None)
+
+
+# ============================================
+# Sampling
+# ============================================
+
+def _frame_name(code):
+    filename = code.co_filename
+    if filename.startswith(ROOT):
+        filename = os.path.relpath(filename, ROOT)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[-1]
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({filename}:{code.co_firstlineno})'
+
+
+class Sampler:
+    """Samples one thread's stack from a background thread."""
+
+    def __init__(self, thread_id, interval_ms):
+        self.thread_id = thread_id
+        self.interval = max(interval_ms, MIN_INTERVAL_MS) / 1000
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        _profiled_threads.add(self.thread_id)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        _profiled_threads.discard(self.thread_id)
+        _active_sql.pop(self.thread_id, None)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            sql = _active_sql.get(self.thread_id)
+            if sql:
+                stack.append(sql)
+            if stack:
+                self.samples[tuple(stack)] += 1
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format (flamegraph.pl, speedscope)."""
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def speedscope(self, name):
+        """A speedscope 'sampled' profile, weighted in milliseconds."""
+        frames, index = [], {}
+        samples, weights = [], []
+        interval_ms = self.interval * 1000
+        for stack, count in self.samples.most_common():
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame})
+            samples.append([index[frame] for frame in stack])
+            weights.append(round(count * interval_ms, 3))
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': 'biblioteca-pessoal profiling.py',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': round(sum(weights), 3),
+                'samples': samples,
+                'weights': weights
+            }]
+        }
+
+
+# ============================================
+# Flask integration
+# ============================================
+
+def _take_budget(per_minute):
+    """Allow at most `per_minute` profiles per rolling minute in this process."""
+    now = time.monotonic()
+    with _budget_lock:
+        while _recent_starts and now - _recent_starts[0] > 60:
+            _recent_starts.popleft()
+        if len(_recent_starts) >= per_minute:
+            return False
+        _recent_starts.append(now)
+        return True
+
+
+def _wants_profile(config):
+    if not any(request.path.startswith(prefix) for prefix in config['PROFILE_ROUTES']):
+        return False
+    token = config['PROFILE_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('X-Profile', ''), token):
+        return True
+    return random.random() < config['PROFILE_FRACTION']
+
+
+def _start_profile():
+    config = current_app.config
+    if not config['PROFILE_ENABLED'] or not _wants_profile(config):
+        return
+    if not _take_budget(config['PROFILE_MAX_PER_MINUTE']):
+        return
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+    g.profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{request.method.lower()}-{slug}"
+    g.profiler = Sampler(threading.get_ident(), config['PROFILE_INTERVAL_MS'])
+    g.profiler.start()
+
+
+def _write_profile(sampler, profile_id, name, folder, fmt):
+    sampler.stop()
+    os.makedirs(folder, exist_ok=True)
+    if fmt == 'collapsed':
+        path = os.path.join(folder, f'{profile_id}.collapsed.txt')
+        content = sampler.collapsed()
+    else:
+        path = os.path.join(folder, f'{profile_id}.speedscope.json')
+        content = json.dumps(sampler.speedscope(name))
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def _finish_profile(response):
+    sampler = g.pop('profiler', None)
+    if sampler is None:
+        return response
+    config = current_app.config
+    profile_id = g.profile_id
+    name = f'{request.method} {request.full_path.rstrip("?")} -> {response.status_code}'
+    response.headers['X-Profile-Id'] = profile_id
+    # Streamed bodies are produced after this hook: stop once they are sent
+    response.call_on_close(lambda: _write_profile(
+        sampler, profile_id, name, config['PROFILE_DIR'], config['PROFILE_FORMAT']
+    ))
+    return response
+
+
+def _discard_profile(exception):
+    # The request failed before a response existed: just stop sampling
+    sampler = g.pop('profiler', None)
+    if sampler is not None:
+        sampler.stop()
+
+
+def init_app(app):
+    """Profile the requests selected by the PROFILE_* settings."""
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_discard_profile)
@@ -0,0 +1,50 @@
+"""Per-request SQL statement accounting.
+
+Every statement executed while a request is being handled is counted (and
+timed) on `flask.g`. With `QUERY_STATS_HEADERS` enabled the totals are sent
+back as `X-DB-Queries` / `X-DB-Time` response headers, which the load
+generator in tools/loadtest.py reads.
+"""
+import time
+from flask import current_app, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if not has_request_context():
+        return
+    g.db_queries = g.get('db_queries', 0) + 1
+    g.db_time = g.get('db_time', 0.0) + elapsed
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+
+def request_stats():
+    """(statements, seconds) spent in the database by the current request."""
+    return g.get('db_queries', 0), g.get('db_time', 0.0)
+
+
+def _add_headers(response):
+    if current_app.config['QUERY_STATS_HEADERS']:
+        queries, seconds = request_stats()
+        response.headers['X-DB-Queries'] = str(queries)
+        response.headers['X-DB-Time'] = f'{seconds * 1000:.2f}'
+    return response
+
+
+def init_app(app):
+    """Expose the per-request statement counts as response headers."""
+    app.after_request(_add_headers)
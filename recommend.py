@@ -0,0 +1,256 @@
+"""Queue suggestions ("what to read next"): ranks the `want_to_read` queue
+by similarity to the books the user rated.
+
+Each book is a sparse vector of author, genre and publisher features plus
+TF-IDF weighted words from its observations and notes. The raw feature
+counts live in `book_features`, one row per book, refreshed by the book and
+note write endpoints, so a change only re-derives that book's row (init-db
+creates the rows of books older than the table).
+
+Because the vectors are L2-normalized, the rating-weighted sum of a queued
+book's cosine similarity to every rated book equals its dot product with a
+single taste profile (the weighted sum of the rated vectors). Ranking the
+queue therefore costs one pass over the non-zero features instead of a
+queue x library similarity matrix. The ranking is cached per process and
+recomputed only when the user's feature rows change.
+"""
+import json
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime
+from sqlalchemy import delete, func, insert, select
+from models import db, Book, BookFeatures, Note
+
+# Book columns the feature rows are derived from
+BOOK_FIELDS = {'author', 'genre', 'publisher', 'observations', 'status', 'rating'}
+# How much each kind of feature counts, relative to one matching word
+FIELD_WEIGHTS = {'author': 3.0, 'genre': 2.0, 'publisher': 1.0, 'word': 1.0}
+# Rating -> weight of a read book in the taste profile (None: finished, unrated)
+RATING_WEIGHTS = {5: 2.0, 4: 1.0, 3: 0.25, 2: -0.5, 1: -1.0, None: 0.25}
+# Words kept per book (the most frequent ones)
+MAX_WORDS = 50
+STOPWORDS = {
+    'para', 'como', 'mais', 'muito', 'muita', 'esse', 'essa', 'isso', 'este',
+    'esta', 'isto', 'aquele', 'aquela', 'pelo', 'pela', 'pelos', 'pelas',
+    'sobre', 'entre', 'quando', 'onde', 'porque', 'sempre', 'tambem', 'ainda',
+    'apenas', 'depois', 'antes', 'assim', 'mesmo', 'mesma', 'cada', 'todo',
+    'toda', 'todos', 'todas', 'outro', 'outra', 'outros', 'outras', 'nada',
+    'tudo', 'algo', 'seus', 'suas', 'dele', 'dela', 'eles', 'elas', 'voce',
+    'minha', 'meus', 'minhas', 'nosso', 'nossa', 'pois', 'entao', 'foram',
+    'sido', 'sendo', 'seria', 'havia', 'livro', 'livros', 'leitura', 'pagina',
+    'paginas', 'capitulo', 'autor', 'autora', 'historia', 'with', 'that',
+    'this', 'from', 'have', 'about', 'what', 'which', 'their', 'there',
+}
+# Suggestions that name the most similar liked book
+EXPLAINED = 20
+# Users whose rankings each worker keeps
+CACHE_SIZE = 256
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+# ============================================
+# Feature extraction
+# ============================================
+
+def _normalize(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+def words(text):
+    """Lowercase, accent-free words of four letters or more, minus stopwords."""
+    return [w for w in re.findall(r'[a-z]{4,}', _normalize(text or '')) if w not in STOPWORDS]
+
+
+def book_features(author, genre, publisher, texts):
+    """Raw {feature: count} of a book, from its fields and free texts."""
+    features = {}
+    for field, value in (('author', author), ('genre', genre), ('publisher', publisher)):
+        if value and value.strip():
+            features[f'{field}:{_normalize(value)}'] = 1
+    counts = Counter(w for text in texts for w in words(text))
+    for word, count in counts.most_common(MAX_WORDS):
+        features[f'word:{word}'] = count
+    return features
+
+
+def refresh_book_features(book_ids):
+    """Recompute the feature rows of some books.
+
+    Call after flushing a book or note write, inside the same transaction.
+    """
+    book_ids = sorted({book_id for book_id in book_ids if book_id is not None})
+    if not book_ids:
+        return
+    books = db.session.execute(
+        select(
+            Book.id, Book.user_id, Book.status, Book.rating,
+            Book.author, Book.genre, Book.publisher, Book.observations
+        ).where(Book.id.in_(book_ids))
+    ).all()
+    notes = defaultdict(list)
+    for book_id, content in db.session.execute(
+        select(Note.book_id, Note.content).where(Note.book_id.in_(book_ids))
+    ):
+        notes[book_id].append(content)
+
+    now = datetime.utcnow()
+    db.session.execute(delete(BookFeatures).where(BookFeatures.book_id.in_(book_ids)))
+    if books:
+        db.session.execute(insert(BookFeatures), [
+            {
+                'book_id': book.id,
+                'user_id': book.user_id,
+                'status': book.status,
+                'rating': book.rating,
+                'features': json.dumps(book_features(
+                    book.author, book.genre, book.publisher,
+                    [book.observations] + notes[book.id]
+                )),
+                'updated_at': now
+            }
+            for book in books
+        ])
+
+
+def refresh_missing_features():
+    """Create the feature rows of books that have none (books older than the table).
+
+    Run by init-db, so that the suggestions endpoint only has to read.
+    Returns the number of books.
+    """
+    missing = db.session.scalars(
+        select(Book.id).outerjoin(BookFeatures, BookFeatures.book_id == Book.id)
+        .where(BookFeatures.book_id.is_(None))
+    ).all()
+    for start in range(0, len(missing), 500):
+        refresh_book_features(missing[start:start + 500])
+    db.session.commit()
+    return len(missing)
+
+
+def rebuild_book_features(user_id=None):
+    """Recompute every feature row (or one user's). Returns the number of books."""
+    stmt = select(Book.id)
+    if user_id is not None:
+        stmt = stmt.where(Book.user_id == user_id)
+    book_ids = db.session.scalars(stmt).all()
+    for start in range(0, len(book_ids), 500):
+        refresh_book_features(book_ids[start:start + 500])
+    db.session.commit()
+    return len(book_ids)
+
+
+# ============================================
+# Ranking
+# ============================================
+
+def _vectors(rows):
+    """L2-normalized weighted vectors of every book, TF-IDF over the library."""
+    document_frequency = Counter(
+        feature for _, _, _, features in rows for feature in features if feature.startswith('word:')
+    )
+    total = len(rows)
+    vectors = {}
+    for book_id, _, _, features in rows:
+        vector = {}
+        for feature, count in features.items():
+            kind = feature.split(':', 1)[0]
+            weight = FIELD_WEIGHTS[kind]
+            if kind == 'word':
+                idf = math.log((total + 1) / (document_frequency[feature] + 1)) + 1
+                weight *= (1 + math.log(count)) * idf
+            vector[feature] = weight
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if norm:
+            vectors[book_id] = {feature: v / norm for feature, v in vector.items()}
+    return vectors
+
+
+def _dot(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(feature, 0.0) for feature, value in a.items())
+
+
+def rank_queue(rows):
+    """Rank the queued books of a library.
+
+    `rows` are (book_id, status, rating, features) tuples. Returns
+    (book_id, score, most_similar_liked_book_id) tuples, best first; the
+    similar book is only named for the first `EXPLAINED` entries.
+    """
+    vectors = _vectors(rows)
+    profile = defaultdict(float)
+    total_weight = 0.0
+    rated = []
+    for book_id, status, rating, _ in rows:
+        if status != 'read' or book_id not in vectors:
+            continue
+        weight = RATING_WEIGHTS.get(rating, RATING_WEIGHTS[None])
+        for feature, value in vectors[book_id].items():
+            profile[feature] += weight * value
+        total_weight += abs(weight)
+        if weight > 0:
+            rated.append((book_id, weight))
+
+    ranking = []
+    for book_id, status, _, _ in rows:
+        if status == 'want_to_read':
+            score = _dot(vectors.get(book_id, {}), profile) / total_weight if total_weight else 0.0
+            ranking.append([book_id, round(score, 4), None])
+    ranking.sort(key=lambda item: -item[1])
+
+    # Name the closest liked book, only for the top suggestions: it needs
+    # the pairwise similarities the profile avoids for everything else
+    postings = defaultdict(list)
+    for book_id, weight in rated:
+        for feature, value in vectors[book_id].items():
+            postings[feature].append((book_id, weight * value))
+    for item in ranking[:EXPLAINED]:
+        similarity = defaultdict(float)
+        for feature, value in vectors.get(item[0], {}).items():
+            for read_id, weighted in postings.get(feature, ()):
+                similarity[read_id] += value * weighted
+        if similarity:
+            item[2] = max(similarity, key=similarity.get)
+    return [tuple(item) for item in ranking]
+
+
+def _version(user_id):
+    """Changes whenever one of the user's feature rows is written or deleted."""
+    count, updated_at = db.session.execute(
+        select(func.count(BookFeatures.book_id), func.max(BookFeatures.updated_at))
+        .where(BookFeatures.user_id == user_id)
+    ).one()
+    return count, updated_at
+
+
+def suggested_queue(user_id):
+    """The user's queue ranking, from the per-process cache when still current."""
+    version = _version(user_id)
+    with _cache_lock:
+        cached = _cache.get(user_id)
+        if cached and cached[0] == version:
+            _cache.move_to_end(user_id)
+            return cached[1]
+
+    rows = [
+        (book_id, status, rating, json.loads(features))
+        for book_id, status, rating, features in db.session.execute(
+            select(BookFeatures.book_id, BookFeatures.status, BookFeatures.rating, BookFeatures.features)
+            .where(BookFeatures.user_id == user_id)
+        )
+    ]
+    ranking = rank_queue(rows)
+    with _cache_lock:
+        _cache[user_id] = (version, ranking)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return ranking
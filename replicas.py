@@ -0,0 +1,68 @@
+"""Read-replica routing.
+
+When `DATABASE_REPLICA_URLS` is set, each replica is registered as a
+`replica<N>` bind (see config.py) and `RoutingSession` sends the reads of
+GET/HEAD requests to one of them (picked once per request). Writes, and
+every statement after one, go to the primary.
+
+Replicas lag behind the primary, so a client that wrote something keeps
+reading from the primary for `REPLICA_STICKY_SECONDS`: the time of its last
+write is kept in the (signed) session cookie, so this holds across workers.
+"""
+import random
+import time
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+
+REPLICA_PREFIX = 'replica'
+READ_METHODS = {'GET', 'HEAD'}
+
+
+def _replica_keys(engines):
+    return [key for key in engines if key and key.startswith(REPLICA_PREFIX)]
+
+
+def recently_wrote():
+    """Whether the current client wrote within the sticky window."""
+    wrote_at = session.get('_db_wrote_at')
+    return wrote_at is not None and time.time() - wrote_at < current_app.config['REPLICA_STICKY_SECONDS']
+
+
+def _request_replica(engines):
+    """The replica engine for this request's reads, or None for the primary."""
+    if 'db_replica' not in g:
+        keys = _replica_keys(engines)
+        use_replica = keys and request.method in READ_METHODS and not recently_wrote()
+        g.db_replica = random.choice(keys) if use_replica else None
+    return engines[g.db_replica] if g.db_replica else None
+
+
+class RoutingSession(Session):
+    """Session that reads from a replica when the request allows it."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            writing = self._flushing or isinstance(clause, sa.UpdateBase)
+            if writing:
+                # Read this write back from the primary for the rest of the request
+                g.db_wrote = True
+                g.db_replica = None
+            elif not g.get('db_wrote'):
+                engine = _request_replica(self._db.engines)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _after_request(response):
+    if g.get('db_wrote'):
+        session['_db_wrote_at'] = time.time()
+    if current_app.config['QUERY_STATS_HEADERS'] and 'db_replica' in g:
+        response.headers['X-DB-Route'] = g.db_replica or 'primary'
+    return response
+
+
+def init_app(app):
+    """Remember writes so that the writer's next reads skip the replicas."""
+    app.after_request(_after_request)
@@ -241,8 +241,15 @@ async function exportData() {
     try {
         showToast('Preparando exportação...', 'success');
 
-        const response = await fetch('/api/export');
-        const data = await response.json();
+        // The export is built by a background job; poll it until it is done
+        let job = await (await fetch('/api/export', { method: 'POST' })).json();
+        while (job.status === 'queued' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            job = await (await fetch(job.url)).json();
+        }
+        if (job.status !== 'done') throw new Error(job.error || 'Export failed');
+
+        const data = await (await fetch(job.result_url)).json();
 
         const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json' });
         const url = URL.createObjectURL(blob);
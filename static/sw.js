@@ -1,18 +1,32 @@
 // Service Worker para Biblioteca Pessoal PWA
-const CACHE_NAME = 'biblioteca-pessoal-v1';
-const STATIC_ASSETS = [
+// Servido em /sw.js com o manifesto de assets (flask build-assets) no topo
+const ASSET_MANIFEST = self.ASSET_MANIFEST || { version: 'dev', files: {} };
+const CACHE_NAME = `biblioteca-pessoal-${ASSET_MANIFEST.version}`;
+const STATIC_PREFIX = '/static/';
+const PAGES = [
     '/',
     '/biblioteca',
     '/fila',
     '/diario',
     '/estatisticas',
-    '/notas',
-    '/static/css/style.css',
-    '/static/js/main.js',
-    '/static/logo.png',
-    '/static/manifest.json'
+    '/notas'
+];
+const SOURCE_ASSETS = [
+    'css/style.css',
+    'js/main.js',
+    'logo.png'
+];
+// Versões com hash (imutáveis) quando o build foi executado
+const STATIC_ASSETS = [
+    ...PAGES,
+    ...SOURCE_ASSETS.map((file) => STATIC_PREFIX + (ASSET_MANIFEST.files[file] || file)),
+    STATIC_PREFIX + 'manifest.json'
 ];
 
+function isFingerprinted(url) {
+    return new URL(url).pathname.startsWith(STATIC_PREFIX + 'dist/');
+}
+
 // Instalação do Service Worker
 self.addEventListener('install', (event) => {
     event.waitUntil(
@@ -54,7 +68,23 @@ self.addEventListener('fetch', (event) => {
         return;
     }
 
-    // Para assets estáticos e páginas: Network First
+    // Assets com hash nunca mudam: Cache First
+    if (isFingerprinted(event.request.url)) {
+        event.respondWith(
+            caches.match(event.request).then((cached) => {
+                return cached || fetch(event.request).then((response) => {
+                    const responseClone = response.clone();
+                    caches.open(CACHE_NAME).then((cache) => {
+                        cache.put(event.request, responseClone);
+                    });
+                    return response;
+                });
+            })
+        );
+        return;
+    }
+
+    // Para demais assets e páginas: Network First
     event.respondWith(
         fetch(event.request)
             .then((response) => {
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# Point the app at a scratch database before anything imports config.py
+_scratch = tempfile.mkdtemp(prefix='biblioteca-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+os.environ['UPLOAD_FOLDER'] = os.path.join(_scratch, 'uploads')
+os.environ['JOB_WORKERS'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
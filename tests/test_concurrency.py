@@ -0,0 +1,123 @@
+"""Concurrency safety of a gthread worker: each thread gets its own database
+session, and a pool sized as in config.py serves WEB_THREADS threads at once."""
+import threading
+import time
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+from config import Config
+from app import app, init_database
+from models import db
+
+THREADS = Config.WEB_THREADS
+ROUNDS = 20
+
+
+def run_threads(target, count=THREADS):
+    """Run `target(index)` in `count` threads; return the exceptions raised."""
+    errors = []
+
+    def run(index):
+        try:
+            target(index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+    return errors
+
+
+@pytest.fixture(scope='module')
+def clients():
+    """One logged-in test client per thread, each user owning one book."""
+    with app.app_context():
+        init_database()
+    clients = []
+    for i in range(THREADS):
+        client = app.test_client()
+        response = client.post('/api/auth/register', json={
+            'username': f'reader{i}', 'email': f'reader{i}@example.com', 'password': 'secret1'
+        })
+        assert response.status_code in (200, 201)
+        assert client.post('/api/books', json={'title': f'Livro de reader{i}'}).status_code == 201
+        clients.append(client)
+    return clients
+
+
+def test_threads_get_their_own_session():
+    barrier = threading.Barrier(THREADS, timeout=10)
+    sessions = []
+
+    def work(index):
+        with app.app_context():
+            session = db.session()
+            barrier.wait()  # every thread holds its session at the same time
+            sessions.append(session)
+
+    assert run_threads(work) == []
+    assert len({id(session) for session in sessions}) == THREADS
+
+
+def test_concurrent_requests_only_see_their_own_user(clients):
+    barrier = threading.Barrier(THREADS, timeout=10)
+
+    def work(index):
+        barrier.wait()
+        for _ in range(ROUNDS):
+            response = clients[index].get('/api/books')
+            assert response.status_code == 200
+            assert [book['title'] for book in response.get_json()] == [f'Livro de reader{index}']
+
+    assert run_threads(work) == []
+
+
+def _hold_connections(engine, count):
+    """Have `count` threads each hold a pooled connection at the same moment."""
+    barrier = threading.Barrier(count, timeout=10)
+
+    def work(index):
+        try:
+            for _ in range(3):
+                with engine.connect() as connection:
+                    barrier.wait()
+                    connection.execute(sa.text('SELECT 1'))
+                    time.sleep(0.01)
+                barrier.wait()
+        except PoolTimeout:
+            barrier.abort()  # release the threads waiting for this one
+            raise
+
+    return run_threads(work, count)
+
+
+def test_configured_pool_serves_every_thread(tmp_path):
+    engine = sa.create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool,
+        **{**Config.DB_POOL_OPTIONS, 'pool_timeout': 2}
+    )
+    try:
+        assert _hold_connections(engine, THREADS) == []
+    finally:
+        engine.dispose()
+
+
+@pytest.mark.skipif(THREADS < 2, reason='pool_size=0 means no limit')
+def test_smaller_pool_times_out(tmp_path):
+    # The check above would catch an undersized pool: one connection short
+    # leaves a thread waiting until the pool times out
+    engine = sa.create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=QueuePool,
+        pool_size=THREADS - 1, max_overflow=0, pool_timeout=1
+    )
+    try:
+        errors = _hold_connections(engine, THREADS)
+    finally:
+        engine.dispose()
+    assert any(isinstance(error, PoolTimeout) for error in errors)
@@ -0,0 +1,78 @@
+"""Measure worker startup: time to import app.py and to serve the first request.
+
+Each run uses a fresh interpreter, like a newly booted gunicorn worker.
+
+    python tools/bench_startup.py --runs 10
+    DATABASE_URL=postgresql://... python tools/bench_startup.py
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter and prints one JSON line
+PROBE = '''
+import json, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get(%r)
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (finished - imported) * 1000,
+    'status': response.status_code
+}))
+'''
+
+
+def run_once(env, path):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE % path],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        'min': round(values[0], 1),
+        'median': round(statistics.median(values), 1),
+        'max': round(values[-1], 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/api/quote', help='first request to time')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if 'DATABASE_URL' not in env:
+        database = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        env['DATABASE_URL'] = f'sqlite:///{database}'
+        for command in ('init-db', 'seed'):
+            subprocess.run(
+                [sys.executable, '-m', 'flask', '--app', 'app', command],
+                cwd=ROOT, env=env, capture_output=True, check=True
+            )
+
+    runs = [run_once(env, args.path) for _ in range(args.runs)]
+    print(json.dumps({
+        'runs': args.runs,
+        'path': args.path,
+        'status': sorted({r['status'] for r in runs}),
+        'import_ms': summarize([r['import_ms'] for r in runs]),
+        'first_request_ms': summarize([r['first_request_ms'] for r in runs])
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""Load generator that replays the API fan-out of each page.
+
+Every template loads its data with a few parallel API calls once the HTML
+arrives. This tool signs up synthetic users (with seeded books, diary
+entries and notes), then has each virtual user repeatedly open a random page:
+fetch the HTML, then fire that page's API calls in parallel, like a browser.
+
+It reports, per page type, throughput, page-load latency percentiles and the
+database statements issued (read from the X-DB-Queries header, which the
+server sends when QUERY_STATS_HEADERS=1).
+
+    # Start a local gunicorn on a throwaway SQLite database and load it
+    python tools/loadtest.py --spawn --users 20 --duration 30
+
+    # Same against a local Postgres
+    DATABASE_URL=postgresql://localhost/biblioteca python tools/loadtest.py --spawn
+
+    # An already running server (start it with QUERY_STATS_HEADERS=1)
+    python tools/loadtest.py --url http://127.0.0.1:8000
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Page -> API calls its template makes on load (base.html adds /api/auth/me)
+PAGES = {
+    'dashboard': ('/', ['/api/auth/me', '/api/stats/overview', '/api/quote']),
+    'library': ('/biblioteca', ['/api/auth/me', '/api/books', '/api/filters']),
+    'queue': ('/fila', ['/api/auth/me', '/api/queue']),
+    'diary': ('/diario', ['/api/auth/me', '/api/diary?month={month}&year={year}', '/api/books?status=reading']),
+    'stats': ('/estatisticas', [
+        '/api/auth/me', '/api/stats/overview', '/api/stats/pages?period=month',
+        '/api/stats/publishers', '/api/stats/spending', '/api/stats/reading-time'
+    ]),
+    'notes': ('/notas', ['/api/auth/me', '/api/notes', '/api/books']),
+}
+
+GENRES = ['Romance', 'Fantasia', 'Ficção Científica', 'Biografia', 'Poesia', 'História']
+PUBLISHERS = ['Companhia das Letras', 'Rocco', 'Intrínseca', 'Record', 'Aleph']
+
+
+class Client:
+    """A logged-in synthetic user with its own cookie jar."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+
+    def request(self, path, method='GET', data=None):
+        """Returns (status, seconds, db_queries)."""
+        body = json.dumps(data).encode() if data is not None else None
+        req = urllib.request.Request(
+            self.base_url + path, data=body, method=method,
+            headers={'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'}
+        )
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as e:
+            e.read()
+            status, headers = e.code, e.headers
+        queries = headers.get('X-DB-Queries')
+        return status, time.perf_counter() - started, int(queries) if queries else None
+
+    def post(self, path, data):
+        status, _, _ = self.request(path, 'POST', data)
+        if status >= 400:
+            raise RuntimeError(f'POST {path} failed with {status}')
+
+
+def seed_user(base_url, index, books, run_id):
+    """Register a user and give them a realistic library and diary."""
+    client = Client(base_url)
+    client.post('/api/auth/register', {
+        'username': f'load{run_id}u{index}',
+        'email': f'load{run_id}u{index}@example.com',
+        'password': 'loadtest'
+    })
+    rng = random.Random(index)
+    today = date.today()
+    for n in range(books):
+        status = rng.choice(['read', 'read', 'reading', 'want_to_read', 'want_to_read'])
+        client.post('/api/books', {
+            'title': f'Livro {n}',
+            'author': f'Autor {rng.randint(1, books // 3 + 1)}',
+            'publisher': rng.choice(PUBLISHERS),
+            'genre': rng.choice(GENRES),
+            'pages': rng.randint(120, 800),
+            'status': status,
+            'purchase_price': round(rng.uniform(20, 120), 2),
+            'purchase_date': (today - timedelta(days=rng.randint(0, 700))).isoformat(),
+            'start_date': (today - timedelta(days=rng.randint(30, 400))).isoformat() if status != 'want_to_read' else None,
+            'end_date': (today - timedelta(days=rng.randint(0, 29))).isoformat() if status == 'read' else None,
+        })
+    # Fetch the ids back once instead of parsing every POST response
+    with client.opener.open(base_url + '/api/books', timeout=60) as response:
+        book_ids = [book['id'] for book in json.load(response)]
+    for day in range(min(books * 3, 365)):
+        client.post('/api/diary', {
+            'date': (today - timedelta(days=day)).isoformat(),
+            'book_id': rng.choice(book_ids),
+            'pages_read': rng.randint(0, 60),
+            'reading_time': rng.randint(10, 90)
+        })
+    for n in range(books):
+        client.post('/api/notes', {'book_id': rng.choice(book_ids), 'content': f'Nota {n}'})
+    return client
+
+
+def load_page(client, page, pool):
+    """Open a page like a browser: HTML first, then the API calls in parallel.
+
+    Returns (ok, seconds, db_queries).
+    """
+    path, api_calls = PAGES[page]
+    today = date.today()
+    started = time.perf_counter()
+    results = [client.request(path)]
+    calls = [call.format(month=today.month, year=today.year) for call in api_calls]
+    results += list(pool.map(client.request, calls))
+    elapsed = time.perf_counter() - started
+    ok = all(status < 400 for status, _, _ in results)
+    queries = [q for _, _, q in results if q is not None]
+    return ok, elapsed, sum(queries) if queries else None
+
+
+def run(base_url, clients, duration, fan_out, weights):
+    samples = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    pages = list(weights)
+
+    def virtual_user(client):
+        rng = random.Random()
+        with ThreadPoolExecutor(fan_out) as pool:
+            while time.monotonic() < deadline:
+                page = rng.choices(pages, [weights[p] for p in pages])[0]
+                sample = load_page(client, page, pool)
+                with lock:
+                    samples[page].append(sample)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=virtual_user, args=(c,)) for c in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def report(samples, elapsed):
+    rows = []
+    for page in sorted(samples):
+        page_samples = samples[page]
+        latencies = [s[1] * 1000 for s in page_samples]
+        queries = [s[2] for s in page_samples if s[2] is not None]
+        rows.append({
+            'page': page,
+            'loads': len(page_samples),
+            'errors': sum(1 for s in page_samples if not s[0]),
+            'loads_per_s': round(len(page_samples) / elapsed, 2),
+            'p50_ms': round(statistics.median(latencies), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'queries_per_load': round(statistics.mean(queries), 1) if queries else None,
+            'queries_per_s': round(sum(queries) / elapsed, 1) if queries else None,
+        })
+    return rows
+
+
+def print_table(rows):
+    columns = list(rows[0]) if rows else []
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print('  '.join(str(row[c]).ljust(widths[c]) for c in columns))
+
+
+def spawn_server(port, workers):
+    """Start gunicorn on a fresh database; returns the process."""
+    env = dict(os.environ, QUERY_STATS_HEADERS='1')
+    if 'DATABASE_URL' not in env:
+        env['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'loadtest.db')}"
+    for command in ('init-db', 'seed'):
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', command],
+                       cwd=ROOT, env=env, check=True, capture_output=True)
+    args = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+            '--bind', f'127.0.0.1:{port}', 'app:app']
+    if workers:
+        args += ['--workers', str(workers)]
+    process = subprocess.Popen(args, cwd=ROOT, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base_url + '/api/quote', timeout=1)
+            return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='base URL of a running server')
+    target.add_argument('--spawn', action='store_true', help='start a local gunicorn')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, help='gunicorn workers when spawning')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--books', type=int, default=50, help='books seeded per user')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load')
+    parser.add_argument('--fan-out', type=int, default=6, help='parallel requests per page (browser limit)')
+    parser.add_argument('--pages', default=','.join(PAGES),
+                        help='page mix, e.g. "dashboard:3,stats:1"')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    weights = {}
+    for item in args.pages.split(','):
+        name, _, weight = item.partition(':')
+        if name not in PAGES:
+            parser.error(f'unknown page {name!r}')
+        weights[name] = float(weight or 1)
+
+    process = None
+    base_url = args.url
+    if args.spawn:
+        process, base_url = spawn_server(args.port, args.workers)
+    try:
+        run_id = f'{int(time.time()) % 100000}{random.randint(0, 99)}'
+        print(f'Seeding {args.users} users with {args.books} books each...', file=sys.stderr)
+        with ThreadPoolExecutor(min(args.users, 8)) as pool:
+            clients = list(pool.map(
+                lambda i: seed_user(base_url, i, args.books, run_id), range(args.users)
+            ))
+        print(f'Running for {args.duration}s...', file=sys.stderr)
+        samples, elapsed = run(base_url, clients, args.duration, args.fan_out, weights)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    rows = report(samples, elapsed)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""Query-plan regression check: EXPLAIN every statement the endpoints issue.
+
+Seeds a throwaway database with a few thousand books, diary entries and
+notes spread over several users, calls each endpoint in ENDPOINTS as one of
+them, records the SQL it runs and explains it (`EXPLAIN QUERY PLAN` on
+SQLite, `EXPLAIN (FORMAT JSON)` on Postgres). The plans are compared with
+the committed snapshot in tools/query_plans/<dialect>.json, and full scans
+of the large tables are listed.
+
+    # Compare against the snapshot (exit status 1 on any difference)
+    python tools/query_plans.py
+
+    # Accept the current plans after reviewing the diff
+    python tools/query_plans.py --update
+
+    # Postgres: point it at an EMPTY scratch database
+    python tools/query_plans.py --database-url postgresql://localhost/plans_scratch
+"""
+import argparse
+import difflib
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT_DIR = os.path.join(ROOT, 'tools', 'query_plans')
+
+# Tables that grow with usage: a full scan of one of these is a regression
+LARGE_TABLES = {
+    'books', 'reading_diary', 'notes', 'daily_reading_rollups', 'book_features', 'jobs',
+    'community_book_facts', 'community_deltas', 'community_stats'
+}
+
+# (name, method, path, JSON body); {book} is one of the user's books,
+# {entry} one of their diary entries and {note} one of their notes
+ENDPOINTS = [
+    ('auth_me', 'GET', '/api/auth/me', None),
+    ('books', 'GET', '/api/books', None),
+    ('books_filtered', 'GET', '/api/books?status=read&genre=Romance&author=Autor%201&search=livro', None),
+    ('book', 'GET', '/api/books/{book}', None),
+    ('book_current', 'GET', '/api/books/current', None),
+    ('book_patch', 'PATCH', '/api/books/{book}', {'rating': 4}),
+    ('queue', 'GET', '/api/queue', None),
+    ('queue_suggested', 'GET', '/api/queue/suggested', None),
+    ('forecast', 'GET', '/api/forecast', None),
+    ('diary_month', 'GET', '/api/diary?month={month}&year={year}', None),
+    ('diary_calendar', 'GET', '/api/diary/calendar?from={year_ago}&to={today}', None),
+    ('diary_day', 'GET', '/api/diary/{today}', None),
+    ('diary_update', 'PUT', '/api/diary/{entry}', {'pages_read': 12}),
+    ('stats_overview', 'GET', '/api/stats/overview', None),
+    ('stats_pages_day', 'GET', '/api/stats/pages?period=day', None),
+    ('stats_pages_month', 'GET', '/api/stats/pages?period=month', None),
+    ('stats_pages_year', 'GET', '/api/stats/pages?period=year', None),
+    ('stats_publishers', 'GET', '/api/stats/publishers', None),
+    ('stats_spending', 'GET', '/api/stats/spending', None),
+    ('stats_reading_time', 'GET', '/api/stats/reading-time', None),
+    ('stats_heatmap', 'GET', '/api/stats/heatmap', None),
+    ('stats_weekdays', 'GET', '/api/stats/weekdays', None),
+    ('stats_moving_average', 'GET', '/api/stats/moving-average', None),
+    ('stats_year_in_review', 'GET', '/api/stats/year-in-review', None),
+    ('community', 'GET', '/api/community', None),
+    ('notes', 'GET', '/api/notes', None),
+    ('notes_book', 'GET', '/api/notes/book/{book}', None),
+    ('note_update', 'PUT', '/api/notes/{note}', {'content': 'Releitura: ainda melhor'}),
+    ('filters', 'GET', '/api/filters', None),
+    ('export', 'GET', '/api/export', None),
+    ('quote', 'GET', '/api/quote', None),
+]
+
+USERS = 20
+BOOKS_PER_USER = 200
+DIARY_DAYS = 365
+NOTES_PER_USER = 100
+GENRES = ['Romance', 'Fantasia', 'Ficção Científica', 'Biografia', 'Poesia', 'História']
+
+
+# ============================================
+# Setup
+# ============================================
+
+def seed(db, models):
+    """Fill the database with a deterministic, realistically sized dataset."""
+    rng = random.Random(42)
+    today = date.today()
+    for u in range(USERS):
+        user = models.User(username=f'plans{u}', email=f'plans{u}@example.com')
+        user.set_password('plans123')
+        db.session.add(user)
+        db.session.flush()
+        books = []
+        for n in range(BOOKS_PER_USER):
+            status = rng.choice(['read', 'read', 'reading', 'want_to_read', 'want_to_read'])
+            books.append(models.Book(
+                user_id=user.id, title=f'Livro {n}', author=f'Autor {rng.randint(1, 60)}',
+                publisher=f'Editora {rng.randint(1, 15)}', genre=rng.choice(GENRES),
+                pages=rng.randint(120, 800), status=status, queue_order=n,
+                rating=rng.randint(1, 5) if status == 'read' else None,
+                purchase_price=round(rng.uniform(20, 120), 2),
+                purchase_date=today - timedelta(days=rng.randint(0, 700)),
+                start_date=today - timedelta(days=rng.randint(30, 400)) if status != 'want_to_read' else None,
+                end_date=today - timedelta(days=rng.randint(0, 29)) if status == 'read' else None,
+                observations=rng.choice(['Clássico', 'Emocionante', 'Lento no início', None])
+            ))
+        db.session.add_all(books)
+        db.session.flush()
+        db.session.add_all(
+            models.ReadingDiary(
+                user_id=user.id, book_id=rng.choice(books).id,
+                date=today - timedelta(days=day), pages_read=rng.randint(0, 60),
+                reading_time=rng.randint(10, 90)
+            )
+            for day in range(DIARY_DAYS)
+        )
+        db.session.add_all(
+            models.Note(user_id=user.id, book_id=rng.choice(books).id, content=f'Nota {n} sobre o livro')
+            for n in range(NOTES_PER_USER)
+        )
+    db.session.commit()
+    models.repair_reading_progress()
+    # Inserted directly, so fill the derived rows as init-db would
+    import recommend
+    recommend.refresh_missing_features()
+
+
+def _placeholders(db, models, user_id):
+    today = date.today()
+    first = lambda model: db.session.scalar(
+        db.select(model.id).where(model.user_id == user_id).order_by(model.id).limit(1)
+    )
+    return {
+        'book': first(models.Book), 'entry': first(models.ReadingDiary), 'note': first(models.Note),
+        'today': today.isoformat(), 'year_ago': (today - timedelta(days=365)).isoformat(),
+        'month': today.month, 'year': today.year,
+    }
+
+
+# ============================================
+# Capture and EXPLAIN
+# ============================================
+
+def normalize_sql(statement):
+    return re.sub(r'\s+', ' ', statement).strip()
+
+
+def explain(connection, statement, parameters):
+    """Plan of one statement as a list of stable, readable lines."""
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+        depth = {0: -1}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node_id] + detail)
+        return lines
+
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    lines = []
+
+    def walk(node, level):
+        # Costs and row estimates move with the data; keep the plan's shape
+        parts = [node['Node Type']]
+        if node.get('Relation Name'):
+            parts.append(f"on {node['Relation Name']}")
+        if node.get('Index Name'):
+            parts.append(f"using {node['Index Name']}")
+        lines.append('  ' * level + ' '.join(parts))
+        for child in node.get('Plans', []):
+            walk(child, level + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines
+
+
+def full_scans(dialect, plan):
+    """Large tables the plan reads without an index."""
+    tables = set()
+    for line in plan:
+        line = line.strip()
+        if dialect == 'sqlite':
+            match = re.match(r'SCAN (\w+)(?: AS \w+)?$', line)
+        else:
+            match = re.match(r'Seq Scan on (\w+)', line)
+        if match and match.group(1) in LARGE_TABLES:
+            tables.add(match.group(1))
+    return sorted(tables)
+
+
+def capture(app, db, engine, models):
+    """{endpoint: [{'sql', 'plan'}]} for every endpoint in ENDPOINTS."""
+    from sqlalchemy import event
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and re.match(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b', statement, re.I):
+            statements.append((statement, parameters))
+
+    client = app.test_client()
+    response = client.post('/api/auth/login', json={'email': 'plans0@example.com', 'password': 'plans123'})
+    if response.status_code != 200:
+        raise RuntimeError(f'Login failed: {response.get_json()}')
+    with app.app_context():
+        values = _placeholders(db, models, response.get_json()['user']['id'])
+
+    results = {}
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        for name, method, path, body in ENDPOINTS:
+            statements.clear()
+            response = client.open(path.format(**values), method=method, json=body)
+            response.get_data()  # drain streamed responses
+            if response.status_code >= 400:
+                raise RuntimeError(f'{method} {path} returned {response.status_code}')
+            results[name] = list(statements)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    snapshot = {}
+    with engine.connect() as connection:
+        for name, captured in results.items():
+            seen = set()
+            entries = []
+            for statement, parameters in captured:
+                sql = normalize_sql(statement)
+                if sql in seen:
+                    continue
+                seen.add(sql)
+                entries.append({'sql': sql, 'plan': explain(connection, statement, parameters)})
+            snapshot[name] = entries
+        connection.rollback()
+    return snapshot
+
+
+# ============================================
+# Report
+# ============================================
+
+def _lines(entries):
+    lines = []
+    for entry in entries:
+        lines.append(entry['sql'])
+        lines.extend('    ' + line for line in entry['plan'])
+    return lines
+
+
+def compare(dialect, current, expected):
+    """Print differences and full scans; returns True if everything matches."""
+    ok = True
+    for name in sorted(set(current) | set(expected)):
+        if name not in expected:
+            print(f'+ {name}: new endpoint (not in snapshot)')
+            ok = False
+            continue
+        if name not in current:
+            print(f'- {name}: no longer checked')
+            ok = False
+            continue
+        diff = list(difflib.unified_diff(
+            _lines(expected[name]), _lines(current[name]),
+            f'{name} (snapshot)', f'{name} (current)', lineterm='', n=1
+        ))
+        if diff:
+            ok = False
+            print('\n'.join(diff))
+
+    for name, entries in sorted(current.items()):
+        accepted = {
+            (entry['sql'], table)
+            for entry in expected.get(name, [])
+            for table in full_scans(dialect, entry['plan'])
+        }
+        for entry in entries:
+            for table in full_scans(dialect, entry['plan']):
+                marker = '' if (entry['sql'], table) in accepted else 'NEW '
+                print(f'{marker}full scan of {table} in {name}: {entry["sql"][:100]}')
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url', help='empty scratch database (default: temporary SQLite)')
+    parser.add_argument('--update', action='store_true', help='write the current plans as the snapshot')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'plans.db')}"
+    os.environ['JOB_WORKERS'] = '0'
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import text
+    import models
+    from app import app, init_database
+    from models import db
+
+    with app.app_context():
+        init_database()
+        if db.session.scalar(db.select(db.func.count(models.User.id))):
+            parser.error('the database is not empty; use a scratch database')
+        seed(db, models)
+        engine = db.engine
+        with engine.begin() as connection:
+            connection.execute(text('ANALYZE'))
+    dialect = engine.dialect.name
+
+    current = capture(app, db, engine, models)
+    path = os.path.join(SNAPSHOT_DIR, f'{dialect}.json')
+    if args.update:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(current, f, indent=2, ensure_ascii=False, sort_keys=True)
+            f.write('\n')
+        print(f'Snapshot written to {os.path.relpath(path, ROOT)}')
+        return
+
+    if not os.path.exists(path):
+        print(f'No snapshot for {dialect} yet: run with --update and commit it')
+        sys.exit(1)
+    with open(path) as f:
+        expected = json.load(f)
+    if not compare(dialect, current, expected):
+        print(f'\nQuery plans differ from {os.path.relpath(path, ROOT)}; '
+              'review and run with --update to accept.')
+        sys.exit(1)
+    print(f'Query plans match the {dialect} snapshot ({len(current)} endpoints).')
+
+
+if __name__ == '__main__':
+    main()